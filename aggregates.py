@@ -0,0 +1,130 @@
+# aggregates.py
+
+from array import array
+from data_cache import LocalCache
+from sort_keys import number_value
+
+
+def dispatch_state(value):
+    """'received', 'dispatched' или None — по тексту поля dispatch_info."""
+    dispatch = str(value or '').strip().lower()
+    if not dispatch:
+        return None
+    return 'received' if 'получил' in dispatch else 'dispatched'
+
+
+class RegistryAggregates:
+    """
+    Итоги по отфильтрованному реестру: тоннаж, расход топлива, сколько
+    записей сдано и отправлено.
+
+    Числовые поля разбираются один раз на запись ('12,5' и '12.5') в
+    плотные массивы по номеру записи. update() сверяется с версией вида
+    реестра (RegistryViewModel) и перечитывает только изменившиеся записи;
+    весь список разбирается лишь при первом вызове или потере истории.
+    Итог по набору ключей считается по массивам; если набор мало
+    отличается от предыдущего, к прошлому итогу прибавляются и
+    вычитаются только изменившиеся записи.
+    """
+    def __init__(self):
+        self.version = None
+        self.positions = {}
+        self.tonn = array('d')
+        self.fuel = array('d')
+        self.received = bytearray()
+        self.dispatched = bytearray()
+        self._free = []
+        self._last_keys = None
+        self._last_totals = None
+
+    def update(self, view):
+        """Приводит массивы к текущей версии вида реестра."""
+        changes = view.changes_since(self.version) if self.version is not None else None
+        if changes is None:
+            version, items = view.snapshot()
+            self.rebuild(items, version)
+        else:
+            self.apply_changes(*changes)
+
+    def rebuild(self, items, version):
+        self.version = version
+        self.positions = {}
+        self.tonn = array('d')
+        self.fuel = array('d')
+        self.received = bytearray()
+        self.dispatched = bytearray()
+        self._free = []
+        for item in items:
+            key = LocalCache.record_key(item)
+            if key is None or key in self.positions:
+                continue
+            pos = self.positions[key] = self._slot()
+            self._store(pos, item)
+        self._last_keys = None
+        self._last_totals = None
+
+    def apply_changes(self, version, upserted, deleted):
+        """Точечно обновляет записи; прошлый итог поправляется на разницу."""
+        last = self._last_keys
+        changed = set(deleted)
+        changed.update(LocalCache.record_key(item) for item in upserted)
+        touched = changed & last if last is not None else ()
+        if touched:
+            self._add(self._last_totals, touched, -1)
+        for key in deleted:
+            pos = self.positions.pop(key, None)
+            if pos is not None:
+                self._free.append(pos)
+        for item in upserted:
+            key = LocalCache.record_key(item)
+            if key is None:
+                continue
+            pos = self.positions.get(key)
+            if pos is None:
+                pos = self._slot()
+                self.positions[key] = pos
+            self._store(pos, item)
+        if touched:
+            self._add(self._last_totals, touched, 1)
+        self.version = version
+
+    def _slot(self):
+        if self._free:
+            return self._free.pop()
+        self.tonn.append(0.0)
+        self.fuel.append(0.0)
+        self.received.append(0)
+        self.dispatched.append(0)
+        return len(self.tonn) - 1
+
+    def _store(self, pos, item):
+        self.tonn[pos] = number_value(item.get('tonn')) or 0.0
+        self.fuel[pos] = number_value(item.get('fuel_consumption')) or 0.0
+        state = dispatch_state(item.get('dispatch_info'))
+        self.received[pos] = state == 'received'
+        self.dispatched[pos] = state == 'dispatched'
+
+    def _add(self, totals, keys, sign):
+        for key in keys:
+            pos = self.positions.get(key)
+            if pos is None:
+                continue
+            totals['tonn'] += sign * self.tonn[pos]
+            totals['fuel'] += sign * self.fuel[pos]
+            totals['received'] += sign * self.received[pos]
+            totals['dispatched'] += sign * self.dispatched[pos]
+
+    def summary(self, keys):
+        """Итоги по ключам записей (id/temp_id) текущего вида."""
+        keys = set(keys)
+        last = self._last_keys
+        if last is not None and len(keys ^ last) < len(keys):
+            totals = dict(self._last_totals)
+            self._add(totals, keys - last, 1)
+            self._add(totals, last - keys, -1)
+        else:
+            totals = {'tonn': 0.0, 'fuel': 0.0, 'received': 0, 'dispatched': 0}
+            self._add(totals, keys, 1)
+        self._last_keys = keys
+        self._last_totals = totals
+        return dict(totals)
@@ -3,15 +3,63 @@
 import requests
 from requests.auth import HTTPBasicAuth
 from data_cache import LocalCache
+from sqlite_cache import SQLiteCache
+from pending_journal import PendingJournal
+from numberpl_index import NumberPLIndex
+from registry_view import RegistryViewModel
+from reference_data import ReferenceDataStore
+from single_flight import SingleFlight
 import json
+import hashlib
 from urllib.parse import urlencode
 import concurrent.futures
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+
+# Эндпоинты, которые синхронизируются инкрементально (только изменения)
+DELTA_SYNC_ENDPOINTS = ('registries',)
+# Запас по времени для курсора updated_since (изменения, пришедшие во время запроса)
+DELTA_CURSOR_OVERLAP = timedelta(seconds=60)
+# Коды ответа, при которых запрос стоит повторить (None — ошибка сети)
+TRANSIENT_STATUS_CODES = (None, 408, 425, 429, 500, 502, 503, 504)
+# Сколько секунд результат синхронизации эндпоинта переиспользуется без запроса
+SYNC_FRESH_SECONDS = 3.0
+# Сколько справочник считается свежим после загрузки (sync_all_parallel
+# его не запрашивает); устаревший проверяется условным запросом
+REFERENCE_TTL = {
+    'seasons': timedelta(hours=24),
+    'organizations': timedelta(hours=24),
+    'customers': timedelta(hours=24),
+    'car-markas': timedelta(hours=24),
+    'car-models': timedelta(hours=24),
+    'ie-profiles': timedelta(hours=12),
+    'gruzes': timedelta(hours=12),
+    'loading-points': timedelta(hours=12),
+    'unloading-points': timedelta(hours=12),
+    'podryads': timedelta(hours=1),
+    'drivers': timedelta(hours=1),
+    'cars': timedelta(hours=1),
+    'cargo-batches': timedelta(minutes=15),
+}
+DEFAULT_REFERENCE_TTL = timedelta(hours=1)
 
 class APIClient:
-    def __init__(self, base_url="https://agroup14.ru/api/v1/"):
+    def __init__(self, base_url="https://agroup14.ru/api/v1/", cache_backend="json"):
         self.base_url = base_url
         self.session = requests.Session()
-        self.cache = LocalCache()
+        # "json" — файл на эндпоинт, "sqlite" — построчное хранение в cache/cache.sqlite3
+        self.cache = SQLiteCache() if cache_backend == "sqlite" else LocalCache()
+        self._journals = {}
+        self._journals_lock = threading.Lock()
+        self._numberpl_index = None
+        self._registry_view = None
+        self.reference_data = ReferenceDataStore(self.cache)
+        self._meta_lock = threading.Lock()
+        self._sync_flights = SingleFlight(SYNC_FRESH_SECONDS)
+        # Политика свежести справочников: эндпоинт → TTL (можно переопределить)
+        self.reference_ttl = dict(REFERENCE_TTL)
         self.current_user = None
         self.current_user_id = None 
         self.on_data_updated_callback = None
@@ -80,6 +128,10 @@ class APIClient:
         if creds:
             self.current_user = creds['username']
             self.session.auth = HTTPBasicAuth(creds['username'], creds['password'])
+            # id пользователя известен из кэша — не ждем /users/me/ для created_by
+            info = self.get_current_user_info()
+            if isinstance(info, dict) and info.get('username') == creds['username']:
+                self.current_user_id = info.get('id')
             return True, "Данные загружены из кэша."
         return False, "Нет сохраненных данных."
 
@@ -95,25 +147,153 @@ class APIClient:
     def logout(self):
         self.session = requests.Session()
         self.current_user = None
-        auth_file = self.cache.get_cache_file('auth')
-        if auth_file.exists():
-            auth_file.unlink()
+        self.cache.delete_data('auth')
 
-    def sync_endpoint(self, endpoint, progress_callback=None):
+    # ---------- состояние кэша ----------
+    def get_sync_state(self):
+        """Когда и для какого пользователя выполнялась полная синхронизация."""
+        return self.cache.load_data('sync_state') or {}
+
+    def mark_full_sync(self):
+        self.cache.save_data('sync_state', {
+            'user': self.current_user,
+            'synced_at': datetime.now().isoformat(timespec='seconds'),
+        })
+
+    def has_warm_cache(self, endpoints):
+        """
+        True, если в кэше есть все справочники, реестр и данные пользователя
+        от прошлой полной синхронизации этого же пользователя — тогда окно
+        можно показать сразу, а обновление выполнить в фоне.
+        """
+        state = self.get_sync_state()
+        if not state.get('synced_at') or state.get('user') != self.current_user:
+            return False
+        if self.get_current_user_info() is None:
+            return False
+        return all(self.cache.load_data(e) is not None for e in list(endpoints) + ['registries'])
+
+    # ---------- метаданные синхронизации ----------
+    def get_sync_meta(self, endpoint):
+        """ETag/Last-Modified/курсор последней синхронизации эндпоинта."""
+        return dict((self.cache.load_data('sync_meta') or {}).get(endpoint) or {})
+
+    def update_sync_meta(self, endpoint, **fields):
+        with self._meta_lock:
+            meta = dict(self.cache.load_data('sync_meta') or {})
+            entry = dict(meta.get(endpoint) or {})
+            entry.update(fields)
+            meta[endpoint] = entry
+            self.cache.save_data('sync_meta', meta)
+
+    def is_fresh(self, endpoint, meta=None):
+        """Справочник загружен недавно (в пределах TTL) и есть в кэше."""
+        meta = self.get_sync_meta(endpoint) if meta is None else meta
+        try:
+            fetched_at = datetime.fromisoformat(meta['fetched_at'])
+        except (KeyError, TypeError, ValueError):
+            return False
+        ttl = self.reference_ttl.get(endpoint, DEFAULT_REFERENCE_TTL)
+        return datetime.now() - fetched_at < ttl and self.cache.load_data(endpoint) is not None
+
+    @staticmethod
+    def _content_hash(data):
+        """Хэш содержимого ответа — одинаковые данные не перезаписываются в кэш."""
+        raw = json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _server_time(response, body=None):
+        """Время сервера для курсора: из ответа, иначе из заголовка Date."""
+        if isinstance(body, dict) and body.get('server_time'):
+            return body['server_time']
+        header = response.headers.get('X-Server-Time')
+        if header:
+            return header
+        try:
+            server_dt = parsedate_to_datetime(response.headers['Date'])
+        except (KeyError, TypeError, ValueError):
+            server_dt = datetime.now(timezone.utc)
+        return (server_dt - DELTA_CURSOR_OVERLAP).isoformat()
+
+    @staticmethod
+    def _is_delta_response(response, body):
+        return isinstance(body, dict) and (
+            'deleted' in body or response.headers.get('X-Delta-Sync') == '1'
+        )
+
+    def sync_endpoint(self, endpoint, progress_callback=None, incremental=None):
+        """
+        Загружает эндпоинт в кэш. Одновременные вызовы для одного эндпоинта
+        (автосинхронизация, кнопка обновления, фоновая отправка) делят один
+        запрос и его результат; вызов в течение SYNC_FRESH_SECONDS после
+        завершения получает прошлый результат без обращения к серверу.
+        """
+        return self._sync_flights.run(
+            endpoint,
+            lambda: self._sync_endpoint_once(endpoint, progress_callback, incremental)
+        )
+
+    def _sync_endpoint_once(self, endpoint, progress_callback=None, incremental=None):
+        """
+        Загружает эндпоинт в кэш. Для DELTA_SYNC_ENDPOINTS при наличии локальных
+        данных запрос условный: If-None-Match/If-Modified-Since и ?updated_since.
+        Сервер отвечает 304 (нет изменений), либо {"results": [...], "deleted": [...],
+        "server_time": ...} — тогда в кэш вливаются только изменения. Если сервер
+        вернул обычный список, используется полная загрузка.
+        """
         if progress_callback:
             progress_callback(f"Загрузка: {endpoint}...")
         url = f"{self.base_url}{endpoint}/"
+        if incremental is None:
+            incremental = endpoint in DELTA_SYNC_ENDPOINTS
+        meta = self.get_sync_meta(endpoint) if incremental else {}
+        headers, params = {}, {}
+        if incremental and self.cache.load_data(endpoint) is not None:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+            if meta.get('cursor') and meta.get('delta_supported', True):
+                params['updated_since'] = meta['cursor']
         try:
-            response = self.session.get(url, timeout=15)
-            if response.status_code == 200:
-                self.cache.save_data(endpoint, response.json())
-                print(f"-> Кэш для '{endpoint}' обновлен.")
-            else:
+            response = self.session.get(url, params=params or None, headers=headers or None, timeout=15)
+            if response.status_code == 304:
+                print(f"-> '{endpoint}': изменений нет.")
+                return True
+            if response.status_code != 200:
                 print(f"-> Ошибка при запросе '{endpoint}': {response.status_code}")
                 return False
+            body = response.json()
+            if params and self._is_delta_response(response, body):
+                changed = [r for r in body.get('results') or [] if isinstance(r, dict)]
+                deleted = body.get('deleted') or []
+                self.cache.upsert_records(endpoint, changed)
+                self.cache.delete_records(endpoint, deleted)
+                print(f"-> Кэш для '{endpoint}' обновлен: изменено {len(changed)}, удалено {len(deleted)}.")
+            elif params:
+                # Сервер не поддерживает updated_since — ответ может быть неполным,
+                # поэтому повторяем обычную полную загрузку
+                print(f"-> '{endpoint}': сервер не поддерживает updated_since, полная загрузка.")
+                self.update_sync_meta(endpoint, delta_supported=False, cursor=None)
+                return self._sync_endpoint_once(endpoint, incremental=False)
+            else:
+                data = body['results'] if isinstance(body, dict) and 'results' in body else body
+                self.cache.compare_and_update(endpoint, data)
+                print(f"-> Кэш для '{endpoint}' обновлен.")
+            if incremental or endpoint in DELTA_SYNC_ENDPOINTS:
+                self.update_sync_meta(
+                    endpoint,
+                    etag=response.headers.get('ETag'),
+                    last_modified=response.headers.get('Last-Modified'),
+                    cursor=self._server_time(response, body),
+                )
         except requests.exceptions.RequestException as e:
             print(f"-> Ошибка сети при синхронизации '{endpoint}': {e}")
             return False
+        except ValueError as e:
+            print(f"-> Некорректный ответ при синхронизации '{endpoint}': {e}")
+            return False
         return True
     
     def sync_current_user(self):
@@ -123,6 +303,8 @@ class APIClient:
             
             if response.status_code == 200:
                 user_data = response.json()
+                if isinstance(user_data, dict) and user_data.get('id') is not None:
+                    self.current_user_id = user_data['id']
                 
                 # Сохраняем данные текущего пользователя
                 self.cache.save_data('current_user_info', user_data)
@@ -146,10 +328,15 @@ class APIClient:
         return self.cache.load_data('current_user_info')
 
 
-    def sync_all_parallel(self, endpoints, progress_callback=None, max_workers=5):
+    def sync_all_parallel(self, endpoints, progress_callback=None, max_workers=5, force=False):
         """
         Синхронизирует несколько endpoints параллельно
         max_workers — количество одновременных запросов (по умолчанию 5)
+
+        Справочник, загруженный в пределах своего TTL (reference_ttl), не
+        запрашивается; устаревший проверяется условным запросом по ETag/
+        Last-Modified, а при 200 с тем же хэшем содержимого кэш не
+        перезаписывается. force=True — безусловная загрузка всех endpoints.
         """
         if progress_callback:
             progress_callback(f"Параллельная синхронизация {len(endpoints)} источников...")
@@ -158,11 +345,35 @@ class APIClient:
         
         def sync_one(endpoint):
             try:
+                meta = self.get_sync_meta(endpoint)
+                if not force and self.is_fresh(endpoint, meta):
+                    return endpoint, True, "свежий"
+                headers = {}
+                if not force and self.cache.load_data(endpoint) is not None:
+                    if meta.get('etag'):
+                        headers['If-None-Match'] = meta['etag']
+                    if meta.get('last_modified'):
+                        headers['If-Modified-Since'] = meta['last_modified']
                 url = f"{self.base_url}{endpoint}/"
-                response = self.session.get(url, timeout=10)  # Уменьшили timeout
+                response = self.session.get(url, headers=headers or None, timeout=10)  # Уменьшили timeout
+                fetched_at = datetime.now().isoformat(timespec='seconds')
+                if response.status_code == 304:
+                    self.update_sync_meta(endpoint, fetched_at=fetched_at)
+                    return endpoint, True, "не изменился"
                 if response.status_code == 200:
-                    self.cache.save_data(endpoint, response.json())
-                    return endpoint, True, None
+                    data = response.json()
+                    digest = self._content_hash(data)
+                    unchanged = digest == meta.get('hash') and self.cache.load_data(endpoint) is not None
+                    if not unchanged:
+                        self.cache.save_data(endpoint, data)
+                    self.update_sync_meta(
+                        endpoint,
+                        fetched_at=fetched_at,
+                        hash=digest,
+                        etag=response.headers.get('ETag'),
+                        last_modified=response.headers.get('Last-Modified'),
+                    )
+                    return endpoint, True, "не изменился" if unchanged else None
                 else:
                     return endpoint, False, f"HTTP {response.status_code}"
             except Exception as e:
@@ -176,63 +387,79 @@ class APIClient:
             total = len(endpoints)
             
             for future in concurrent.futures.as_completed(future_to_endpoint):
-                endpoint, success, error = future.result()
+                endpoint, success, note = future.result()
                 completed += 1
                 
                 if progress_callback:
                     status = "✓" if success else "✗"
-                    progress_callback(f"{status} {endpoint} ({completed}/{total})")
+                    suffix = f", {note}" if success and note else ""
+                    progress_callback(f"{status} {endpoint} ({completed}/{total}{suffix})")
                 
-                if success:
-                    print(f"-> Кэш для '{endpoint}' обновлен.")
+                if not success:
+                    print(f"-> Ошибка при запросе '{endpoint}': {note}")
+                elif note:
+                    print(f"-> '{endpoint}': {note}.")
                 else:
-                    print(f"-> Ошибка при запросе '{endpoint}': {error}")
+                    print(f"-> Кэш для '{endpoint}' обновлен.")
                 
                 results[endpoint] = success
         
         return results
 
+    def get_pending_journal(self, endpoint):
+        """Журнал очереди неотправленных записей эндпоинта (создается при первом обращении)."""
+        if endpoint.startswith('pending_'):
+            endpoint = endpoint[len('pending_'):]
+        with self._journals_lock:
+            journal = self._journals.get(endpoint)
+            if journal is None:
+                journal = self._journals[endpoint] = PendingJournal(self.cache, endpoint)
+            return journal
+
+    def get_numberpl_index(self):
+        """Индекс номеров ПЛ по реестру, очереди и конфликтам."""
+        if self._numberpl_index is None:
+            self._numberpl_index = NumberPLIndex(self.cache, self.get_pending_journal('registries'))
+        return self._numberpl_index
+
+    def get_reference_data(self):
+        """Актуальный снимок справочников (общий для всех виджетов)."""
+        return self.reference_data.snapshot()
+
+    def get_registry_view(self):
+        """Объединенный вид реестра (сервер + очередь + конфликты), актуализированный."""
+        if self._registry_view is None:
+            self._registry_view = RegistryViewModel(self)
+        self._registry_view.refresh()
+        return self._registry_view
+
     def get_local_data(self, endpoint):
+        # Очереди pending_*/conflict_* живут в журнале, а не в кэше
+        if endpoint.startswith('pending_'):
+            return self.get_pending_journal(endpoint).pending_items()
+        if endpoint.startswith('conflict_'):
+            return self.get_pending_journal(endpoint[len('conflict_'):]).conflict_items()
         return self.cache.load_data(endpoint) or []
 
     def add_to_pending_queue(self, endpoint, data):
-        queue_key = f"pending_{endpoint}"
-        pending_items = self.get_local_data(queue_key)
-        pending_items.append(data)
-        self.cache.save_data(queue_key, pending_items)
+        self.get_pending_journal(endpoint).enqueue(data)
         print(f"-> Добавлено в очередь: {data.get('temp_id')}")
 
     def get_pending_count(self, endpoint):
         return len(self.get_pending_queue(endpoint))
 
     def get_pending_queue(self, endpoint):
-        if endpoint.startswith('pending_'):
-            queue_key = endpoint
-        else:
-            queue_key = f"pending_{endpoint}"
-        data = self.cache.load_data(queue_key)
-        if not isinstance(data, list):
-            print(f"-> Некорректная структура {queue_key}, очищаем...")
-            self.cache.save_data(queue_key, [])
-            return []
-        valid = [it for it in data if isinstance(it, dict) and it.get('temp_id')]
-        if len(valid) != len(data):
-            self.cache.save_data(queue_key, valid)
-        return valid
+        return self.get_pending_journal(endpoint).pending_items()
 
     def get_conflict_items(self):
         return self.get_local_data('conflict_registries')
 
-    def mark_as_conflict(self, item, reason):
-        conflicts = self.get_local_data('conflict_registries')
-        item['conflict_reason'] = reason
-        conflicts.append(item)
-        self.cache.save_data('conflict_registries', conflicts)
+    def mark_as_conflict(self, item, reason, endpoint='registries'):
+        """Переносит запись из очереди в список конфликтов."""
+        self.get_pending_journal(endpoint).mark_conflict(item, reason)
 
-    def remove_from_conflicts(self, temp_id):
-        conflicts = self.get_local_data('conflict_registries')
-        conflicts = [c for c in conflicts if c.get('temp_id') != temp_id]
-        self.cache.save_data('conflict_registries', conflicts)
+    def remove_from_conflicts(self, temp_id, endpoint='registries'):
+        self.get_pending_journal(endpoint).resolve(temp_id)
 
     def try_send_single_item(self, endpoint, temp_id):
         """Пытается отправить один элемент из очереди"""
@@ -240,10 +467,8 @@ class APIClient:
             print(f"Нет сети, отправка {temp_id} отложена.")
             return False
         
-        queue_key = f"pending_{endpoint}"
-        pending_items = self.get_local_data(queue_key)
-        
-        item_to_send = next((item for item in pending_items if item.get('temp_id') == temp_id), None)
+        journal = self.get_pending_journal(endpoint)
+        item_to_send = journal.get(temp_id)
         
         if not item_to_send:
             return False
@@ -254,11 +479,7 @@ class APIClient:
         conflict = self.check_registry_conflict(item_to_send)
         if conflict:
             print(f" ...Обнаружен конфликт: {conflict}")
-            self.mark_as_conflict(item_to_send, conflict)
-            
-            # Удаляем из pending
-            remaining = [item for item in pending_items if item.get('temp_id') != temp_id]
-            self.cache.save_data(queue_key, remaining)
+            self.mark_as_conflict(item_to_send, conflict, endpoint)
             
             if self.on_data_updated_callback:
                 self.on_data_updated_callback()
@@ -269,11 +490,13 @@ class APIClient:
         
         if success:
             # ИСПРАВЛЕНО: Удаляем из pending после успешной отправки
-            remaining_items = [item for item in pending_items if item.get('temp_id') != temp_id]
-            self.cache.save_data(queue_key, remaining_items)
+            journal.mark_sent(temp_id)
             
-            # Синхронизируем реестр для получения серверного ID
-            self.sync_endpoint('registries')
+            # Серверная запись (с ID) из ответа сразу попадает в кэш реестра
+            if isinstance(response_data, dict) and response_data.get('id') is not None:
+                self.cache.upsert_records(endpoint, [response_data])
+            else:
+                self.sync_endpoint(endpoint)
             
             if self.on_data_updated_callback:
                 self.on_data_updated_callback()
@@ -285,20 +508,10 @@ class APIClient:
 
 
     def check_registry_conflict(self, local_item):
-        server_items = self.get_local_data('registries') or []
-        local_numberPL = str(local_item.get('numberPL', '')).strip()
-        local_driver = local_item.get('driver')
-        if not local_numberPL:
-            return None
-        for server_item in server_items:
-            if not isinstance(server_item, dict) or 'id' not in server_item:
-                continue
-            if str(server_item.get('numberPL', '')).strip() == local_numberPL:
-                if local_driver != server_item.get('driver'):
-                    return f"Номер ПЛ {local_numberPL} уже существует с другим водителем"
-        return None
+        return self.get_numberpl_index().check(local_item)
 
     def post_item(self, endpoint, data):
+        self._sync_flights.invalidate(endpoint)
         url = f"{self.base_url}{endpoint}/"
         if not url.endswith('/'):
             url += '/'
@@ -311,13 +524,17 @@ class APIClient:
 
         # Убираем пустые значения
         data = {k: v for k, v in data.items() if v not in [None, '', []]}
+        headers = {'Content-Type': 'application/json'}
+        if temp_id:
+            # Ключ идемпотентности: повторная отправка той же записи не создаст дубль
+            headers['Idempotency-Key'] = str(temp_id)
         print(f"--- Sending POST to {url} ---")
         print(json.dumps(data, indent=2, ensure_ascii=False))
         print("---------------------------------")
         try:
             response = self.session.post(
                 url, json=data, timeout=15,
-                headers={'Content-Type': 'application/json'},
+                headers=headers,
                 allow_redirects=False
             )
             if response.status_code in [301, 302, 303, 307, 308]:
@@ -327,7 +544,7 @@ class APIClient:
                         redirect_url = self.base_url.rstrip('/') + redirect_url
                     response = self.session.post(
                         redirect_url, json=data, timeout=15,
-                        headers={'Content-Type': 'application/json'}
+                        headers=headers
                     )
             print(f"-> HTTP Status: {response.status_code}")
             print(f"-> Request Method: {response.request.method}")
@@ -358,7 +575,34 @@ class APIClient:
                 data['temp_id'] = temp_id
             return False, details, status_code
 
-    def update_item(self, endpoint, item_id, data, use_patch=True):
+    def apply_item_to_cache(self, endpoint, item_id, changes, response_body=None):
+        """
+        Вливает результат изменения записи в кэш эндпоинта: ответ сервера,
+        если он содержит запись целиком, иначе — отправленные поля поверх
+        закэшированной записи.
+        """
+        self.apply_items_to_cache(endpoint, [(item_id, changes, response_body)])
+
+    def apply_items_to_cache(self, endpoint, items):
+        """Пакетный вариант apply_item_to_cache: items — (id, изменения, ответ)."""
+        cached = self.cache.load_data(endpoint)
+        if cached is None:
+            return
+        by_key = None
+        records = []
+        for item_id, changes, response_body in items:
+            if isinstance(response_body, dict) and response_body.get('id') is not None:
+                records.append(response_body)
+                continue
+            if by_key is None:
+                by_key = {self.cache.record_key(r): r for r in cached}
+            existing = by_key.get(str(item_id))
+            if existing is not None:
+                records.append(dict(existing, **changes))
+        self.cache.upsert_records(endpoint, records)
+
+    def update_item(self, endpoint, item_id, data, use_patch=True, notify=True, apply_to_cache=True):
+        self._sync_flights.invalidate(endpoint)
         method = 'PATCH' if use_patch else 'PUT'
         url = f"{self.base_url}{endpoint}/{item_id}/"
         data = {k: v for k, v in data.items() if v not in [None, '', []]}
@@ -392,8 +636,9 @@ class APIClient:
                     body = req.json()
                 except ValueError:
                     body = req.text
-                self.sync_endpoint('registries')
-                if self.on_data_updated_callback:
+                if apply_to_cache:
+                    self.apply_item_to_cache(endpoint, item_id, data, body)
+                if notify and self.on_data_updated_callback:
                     self.on_data_updated_callback()
                 return True, body, req.status_code
             else:
@@ -412,8 +657,58 @@ class APIClient:
                     details += f"\nServer response: {e.response.text}"
             return False, details, status_code
 
+    def bulk_update(self, endpoint, updates, progress_callback=None, max_workers=6, max_retries=2, use_patch=True, notify=True):
+        """
+        Массово изменяет записи: updates — список (id, изменения).
+        Запросы идут параллельно (не более max_workers), временные ошибки
+        повторяются с паузой. progress_callback(done, total, item_id, ok)
+        вызывается из рабочих потоков после каждой записи. Кэш обновляется
+        одним пакетом в конце. Возвращает (список успешных id, {id: (код, ошибка)}).
+        """
+        updates = [(item_id, patch) for item_id, patch in updates if item_id]
+        total = len(updates)
+        if not total:
+            return [], {}
+
+        def send_one(item_id, patch):
+            for attempt in range(max_retries + 1):
+                ok, body, code = self.update_item(
+                    endpoint, item_id, patch, use_patch=use_patch,
+                    notify=False, apply_to_cache=False
+                )
+                if ok or code not in TRANSIENT_STATUS_CODES or attempt == max_retries:
+                    return ok, body, code
+                time.sleep(0.5 * (2 ** attempt))
+
+        applied, ok_ids, errors = [], [], {}
+        done = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(send_one, item_id, patch): (item_id, patch) for item_id, patch in updates}
+            for future in concurrent.futures.as_completed(futures):
+                item_id, patch = futures[future]
+                try:
+                    ok, body, code = future.result()
+                except Exception as e:
+                    ok, body, code = False, str(e), None
+                done += 1
+                if ok:
+                    ok_ids.append(item_id)
+                    applied.append((item_id, patch, body))
+                else:
+                    errors[item_id] = (code, body)
+                if progress_callback:
+                    progress_callback(done, total, item_id, ok)
+
+        if applied:
+            self.apply_items_to_cache(endpoint, applied)
+            if notify and self.on_data_updated_callback:
+                self.on_data_updated_callback()
+        print(f"-> Массовое обновление '{endpoint}': успешно {len(ok_ids)}, ошибок {len(errors)}")
+        return ok_ids, errors
+
     # удаление одного объекта
-    def delete_item(self, endpoint, item_id):
+    def delete_item(self, endpoint, item_id, notify=True):
+        self._sync_flights.invalidate(endpoint)
         url = f"{self.base_url}{endpoint}/{item_id}/"
         print(f"--- DELETE {url} ---")
         try:
@@ -426,8 +721,8 @@ class APIClient:
                     req = self.session.delete(redirect_url, timeout=15)
             print(f"-> HTTP Status: {req.status_code}")
             if req.status_code in [200, 202, 204]:
-                self.sync_endpoint('registries')
-                if self.on_data_updated_callback:
+                self.cache.delete_records(endpoint, [item_id])
+                if notify and self.on_data_updated_callback:
                     self.on_data_updated_callback()
                 return True, None, req.status_code
             else:
@@ -440,7 +735,20 @@ class APIClient:
             status_code = getattr(getattr(e, 'response', None), 'status_code', None)
             return False, str(e), status_code
 
-    def upload_pending_registries(self, progress_callback=None):
+    @staticmethod
+    def _pl_sequence(item):
+        """Порядковый номер из номера ПЛ вида «МАРШРУТ-N» (для сортировки внутри маршрута)."""
+        tail = str(item.get('numberPL') or '').rsplit('-', 1)[-1].strip()
+        return int(tail) if tail.isdigit() else float('inf')
+
+    def upload_pending_registries(self, progress_callback=None, counts_callback=None, max_workers=4, max_retries=2):
+        """
+        Отправляет очередь неотправленных ПЛ. Маршруты (marsh + season) идут
+        параллельно, но внутри маршрута записи отправляются строго по порядку
+        номеров ПЛ; после ошибки остаток маршрута остается в очереди.
+        Каждая подтвержденная запись сразу попадает в кэш реестра.
+        counts_callback(done, total, conflicts, errors) вызывается из рабочих потоков.
+        """
         pending_items = self.get_pending_queue('registries')
         if not pending_items:
             print("-> Нет ожидающих записей для отправки.")
@@ -449,30 +757,73 @@ class APIClient:
             return 0, 0
         if progress_callback:
             progress_callback(f"Отправка локальных записей: {len(pending_items)} шт...")
-        success_count, conflict_count = 0, 0
-        remaining_items = []
+        journal = self.get_pending_journal('registries')
+        total = len(pending_items)
+        counts = {'done': 0, 'sent': 0, 'conflicts': 0, 'errors': 0}
+        counts_lock = threading.Lock()
+        need_resync = []
+
+        def report(key):
+            with counts_lock:
+                counts[key] += 1
+                counts['done'] += 1
+                snapshot = dict(counts)
+            if counts_callback:
+                counts_callback(snapshot['done'], total, snapshot['conflicts'], snapshot['errors'])
+
+        # Конфликты (с сервером и повторы внутри очереди) — одним проходом
+        conflicts = self.get_numberpl_index().check_queue(pending_items)
+        routes = {}
         for item in pending_items:
-            item_to_send = item.copy()
-            temp_id = item_to_send.get('temp_id')
-            conflict = self.check_registry_conflict(item_to_send)
-            if conflict:
-                print(f" ...Обнаружен конфликт: {conflict}")
-                self.mark_as_conflict(item, conflict)
-                conflict_count += 1
+            temp_id = item.get('temp_id')
+            if temp_id in conflicts:
+                print(f" ...Обнаружен конфликт: {conflicts[temp_id]}")
+                self.mark_as_conflict(item, conflicts[temp_id])
+                report('conflicts')
                 continue
-            ok, resp, code = self.post_item("registries", item_to_send)
-            if ok:
-                success_count += 1
-            else:
-                remaining_items.append(item)
-        self.cache.save_data('pending_registries', remaining_items)
-        if success_count > 0:
+            routes.setdefault((item.get('marsh'), item.get('season')), []).append(item)
+
+        def send_route(items):
+            ordered = sorted(items, key=self._pl_sequence)
+            for idx, item in enumerate(ordered):
+                temp_id = item.get('temp_id')
+                for attempt in range(max_retries + 1):
+                    ok, resp, code = self.post_item("registries", item.copy())
+                    if ok or code not in TRANSIENT_STATUS_CODES or attempt == max_retries:
+                        break
+                    time.sleep(0.5 * (2 ** attempt))
+                if not ok:
+                    print(f" ...Ошибка отправки {temp_id} (статус {code}), маршрут приостановлен")
+                    for _ in range(len(ordered) - idx):
+                        report('errors')
+                    return
+                journal.mark_sent(temp_id)
+                if isinstance(resp, dict) and resp.get('id') is not None:
+                    self.cache.upsert_records('registries', [resp])
+                else:
+                    need_resync.append(temp_id)
+                report('sent')
+
+        if routes:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for future in [executor.submit(send_route, items) for items in routes.values()]:
+                    try:
+                        future.result()
+                    except Exception as e:
+                        print(f" ...Ошибка отправки маршрута: {e}")
+
+        if need_resync:
             self.sync_endpoint('registries')
-        return success_count, conflict_count
+        return counts['sent'], counts['conflicts']
 
-    def sync_pending_registries(self, progress_callback=None):
-        success_count, conflict_count = self.upload_pending_registries(progress_callback)
+    def sync_pending_registries(self, progress_callback=None, counts_callback=None):
+        """
+        Отправляет очередь и загружает реестр. Возвращает (отправлено, конфликтов,
+        synced): synced=True, если реестр загружен и в очереди ничего не осталось.
+        """
+        success_count, conflict_count = self.upload_pending_registries(progress_callback, counts_callback)
         if progress_callback:
             progress_callback("Загрузка обновленных данных с сервера...")
-        self.sync_endpoint("registries", progress_callback)
-        return success_count, conflict_count
+        registry_ok = self.sync_endpoint("registries", progress_callback)
+        synced = registry_ok and not self.get_pending_queue('registries')
+        return success_count, conflict_count, synced
@@ -68,43 +68,20 @@ class CreatePLForm(ctk.CTkFrame):
     def _load_data(self):
         self.default_settings = self.api_client.cache.load_data('default_pl_settings') or {}
 
-        endpoints = [
-            'seasons', 'organizations', 'customers', 'gruzes', 'cargo-batches',
-            'drivers', 'cars', 'podryads', 'loading-points', 'unloading-points',
-            'car-markas', 'car-models'
-        ]
-        for endpoint in endpoints:
-            self.related_data[endpoint] = self.api_client.get_local_data(endpoint) or []
+        # Списки и индексы — из общего снимка справочников, без повторного разбора
+        self.reference = self.api_client.get_reference_data()
+        self.related_data = self.reference.lists
 
-        self.drivers_by_id = {d['id']: d for d in self.related_data['drivers'] if isinstance(d, dict) and d.get('id') is not None}
-        self.cars_by_id = {c['id']: c for c in self.related_data['cars'] if isinstance(c, dict) and c.get('id') is not None}
-        self.markas_by_id = {m['id']: m for m in self.related_data['car-markas'] if isinstance(m, dict) and m.get('id') is not None}
-        self.models_by_id = {m['id']: m for m in self.related_data['car-models'] if isinstance(m, dict) and m.get('id') is not None}
-        self.podryads_by_id = {p['id']: p for p in self.related_data['podryads'] if isinstance(p, dict) and p.get('id') is not None}
-        self.gruzes_by_id = {g['id']: g for g in self.related_data['gruzes'] if isinstance(g, dict) and g.get('id') is not None}
+        self.drivers_by_id = self.reference.by_id['drivers']
+        self.cars_by_id = self.reference.by_id['cars']
+        self.markas_by_id = self.reference.by_id['car-markas']
+        self.models_by_id = self.reference.by_id['car-models']
+        self.podryads_by_id = self.reference.by_id['podryads']
+        self.gruzes_by_id = self.reference.by_id['gruzes']
 
         # индекс водитель -> подрядчик
-        self.driver_to_podryad = self._build_driver_contractor_index()
+        self.driver_to_podryad = self.reference.driver_to_podryad
 
-    def _build_driver_contractor_index(self):
-        index = {}
-        for podryad in self.related_data['podryads']:
-            if not isinstance(podryad, dict):
-                continue
-            podryad_id = podryad.get('id')
-            drivers = podryad.get('drivers', [])
-            if isinstance(drivers, list):
-                for item in drivers:
-                    if isinstance(item, dict):
-                        driver_id = item.get('id')
-                    elif isinstance(item, int):
-                        driver_id = item
-                    else:
-                        driver_id = None
-                    if driver_id:
-                        index[driver_id] = podryad_id
-        return index
-    
     # вспомогательное — плоские словари по id для шаблона
     def _dict_maps_for_template(self):
         maps = {}
@@ -114,8 +91,7 @@ class CreatePLForm(ctk.CTkFrame):
             'organizations', 'customers', 'seasons',
             'car-markas', 'car-models'
         ]:
-            items = self.related_data.get(key, [])
-            maps[key] = {itm.get('id'): itm for itm in items if isinstance(itm, dict) and itm.get('id') is not None}
+            maps[key] = self.reference.by_id.get(key, {})
         # передадим также настройки по умолчанию (для distance/dispatcher и т.п.)
         maps['default_pl_settings'] = self.default_settings or {}
         return maps
@@ -425,16 +401,10 @@ class CreatePLForm(ctk.CTkFrame):
         if not season_id:
             return
 
-        registries = self.api_client.get_local_data('registries') or []
-        pending = self.api_client.get_local_data('pending_registries') or []
-
-        count = 0
-        for reg in registries:
-            if isinstance(reg, dict) and reg.get('marsh') == marsh_code and reg.get('season') == season_id:
-                count += 1
-        for reg in pending:
-            if isinstance(reg, dict) and reg.get('marsh') == marsh_code and reg.get('season') == season_id:
-                count += 1
+        count = (
+            len(self.api_client.cache.query_records('registries', marsh=marsh_code, season=season_id))
+            + len(self.api_client.get_pending_journal('registries').query(marsh=marsh_code, season=season_id))
+        )
 
         new_number = f"{marsh_code}-{count + 1}"
         if 'numberPL' in self.form_widgets:
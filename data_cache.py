@@ -1,33 +1,351 @@
 # data_cache.py
 
+import atexit
 import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
 from pathlib import Path
 import hashlib
 
+# Текстовые поля, по которым идет поиск записей (сравниваются без пробелов по краям)
+INDEXED_TEXT_FIELDS = ('numberPL', 'marsh', 'dispatch_info')
+# Сколько последних изменений записей помнить для changes_since
+CHANGE_LOG_LIMIT = 256
+
+
 class LocalCache:
     """
     Управляет сохранением и загрузкой данных в локальные JSON-файлы.
+
+    Поверх файлов работает слой в памяти: разобранные объекты хранятся
+    в LRU-кэше и переиспользуются, пока у файла не изменились mtime/размер.
+    Объекты, возвращаемые load_data, общие для всех вызывающих — менять их
+    на месте можно только с последующим save_data.
+
+    save_data не пишет на диск в вызывающем потоке: данные сразу видны
+    через load_data, а фоновый писатель объединяет повторные сохранения
+    одного ключа за write_delay секунд и атомарно заменяет файл
+    (временный файл + os.replace). flush() дожидается записи всего.
     """
-    def __init__(self, cache_dir="cache"):
+    def __init__(self, cache_dir="cache", max_entries=64, max_bytes=64 * 1024 * 1024, write_delay=0.3):
         self.cache_dir = Path(cache_dir)
         self.cache_dir.mkdir(exist_ok=True)
 
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.RLock()
+        # key -> (data, (mtime_ns, size), weight)
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        # key -> счетчик версий (растет при каждом изменении данных)
+        self._versions = {}
+        # key -> последние изменения записей: (версия, записи, удаленные ключи)
+        self._change_log = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # Отложенная запись: key -> (data, generation), key -> время записи
+        self.write_delay = write_delay
+        self._pending = {}
+        self._due = {}
+        self._generation = 0
+        self._io_lock = threading.Lock()
+        self._writer_cond = threading.Condition(self._lock)
+        self._writer = None
+        atexit.register(self.flush, 10)
+
     def get_cache_file(self, key):
         """Возвращает путь к файлу кэша для указанного ключа (эндпоинта)."""
         return self.cache_dir / f"{key.replace('/', '_')}.json"
 
+    # ---------- слой в памяти ----------
+    def _file_stat(self, cache_file):
+        try:
+            st = os.stat(cache_file)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _bump_version(self, key):
+        self._versions[key] = self._versions.get(key, 0) + 1
+
+    def _drop_entry(self, key):
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= entry[2]
+
+    def _remember(self, key, data, stat):
+        self._drop_entry(key)
+        weight = stat[1] if stat else 0
+        self._memory[key] = (data, stat, weight)
+        self._memory_bytes += weight
+        while self._memory and (len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes):
+            old_key, _ = next(iter(self._memory.items()))
+            if old_key == key:
+                break
+            self._drop_entry(old_key)
+            self.evictions += 1
+
+    def invalidate(self, key=None):
+        """Сбрасывает запись в памяти (или весь кэш, если key не указан)."""
+        with self._lock:
+            keys = [key] if key is not None else list(self._memory.keys())
+            for k in keys:
+                if k in self._memory:
+                    self._drop_entry(k)
+                    self._bump_version(k)
+
+    def get_version(self, key):
+        """
+        Номер версии данных ключа. Меняется при save_data и при изменении
+        файла на диске — по нему можно кэшировать производные структуры.
+        """
+        self.load_data(key)
+        with self._lock:
+            return self._versions.get(key, 0)
+
+    def _log_change(self, key, upserted=(), deleted=()):
+        # Вызывается под self._lock сразу после смены версии ключа
+        log = self._change_log.get(key)
+        if log is None:
+            log = self._change_log[key] = deque(maxlen=CHANGE_LOG_LIMIT)
+        log.append((self._versions.get(key, 0), tuple(upserted), frozenset(deleted)))
+
+    def changes_since(self, key, version):
+        """
+        Изменения записей ключа после версии version: (измененные записи,
+        ключи удаленных записей). None — если между версиями было полное
+        сохранение, изменение файла или история уже не хранится; тогда
+        производные структуры нужно строить по всему списку.
+        """
+        self.get_version(key)
+        with self._lock:
+            current = self._versions.get(key, 0)
+            if version == current:
+                return [], set()
+            if version is None or version > current:
+                return None
+            entries = [e for e in self._change_log.get(key, ()) if e[0] > version]
+            if [e[0] for e in entries] != list(range(version + 1, current + 1)):
+                return None
+            upserted, deleted = {}, set()
+            for _, records, removed in entries:
+                for rec in records:
+                    rkey = self.record_key(rec)
+                    deleted.discard(rkey)
+                    upserted[rkey] = rec
+                for rkey in removed:
+                    upserted.pop(rkey, None)
+                    deleted.add(rkey)
+            return list(upserted.values()), deleted
+
+    def get_stats(self):
+        """Счетчики попаданий/промахов слоя в памяти."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._memory),
+                'bytes': self._memory_bytes,
+                'pending_writes': len(self._pending),
+            }
+
+    # ---------- фоновая запись ----------
+    def _ensure_writer(self):
+        if self._writer is None or not self._writer.is_alive():
+            self._writer = threading.Thread(target=self._writer_loop, name="cache-writer", daemon=True)
+            self._writer.start()
+
+    def _writer_loop(self):
+        while True:
+            with self._lock:
+                while not self._due:
+                    self._writer_cond.wait()
+                key, due = min(self._due.items(), key=lambda kv: kv[1])
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._writer_cond.wait(delay)
+                    continue
+                del self._due[key]
+                data, generation = self._pending[key]
+            self._write_pending(key, data, generation)
+
+    def _write_pending(self, key, data, generation):
+        cache_file = self.get_cache_file(key)
+        tmp_file = cache_file.with_name(f"{cache_file.name}.tmp")
+        with self._io_lock:
+            with self._lock:
+                # Ключ удален или сохранен заново — запишется более новая версия
+                if key not in self._pending or self._pending[key][1] != generation:
+                    return
+            try:
+                with open(tmp_file, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_file, cache_file)
+            except (OSError, TypeError, ValueError, RuntimeError) as e:
+                print(f"-> Ошибка записи кэша '{key}': {e}")
+                with self._lock:
+                    if key in self._pending and key not in self._due:
+                        self._due[key] = time.monotonic() + max(self.write_delay, 1.0)
+                        self._writer_cond.notify_all()
+                return
+            with self._lock:
+                if self._pending.get(key, (None, None))[1] == generation:
+                    del self._pending[key]
+                    self._remember(key, data, self._file_stat(cache_file))
+                self._writer_cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Записывает на диск все отложенные сохранения и ждет окончания."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            if not self._pending:
+                return True
+            now = time.monotonic()
+            for key in self._pending:
+                self._due[key] = now
+            self._ensure_writer()
+            self._writer_cond.notify_all()
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._writer_cond.wait(remaining)
+            return True
+
+    # ---------- основное API ----------
     def load_data(self, key):
-        """Загружает данные из файла кэша."""
+        """
+        Загружает данные из файла кэша. Разбор файла идет вне блокировки,
+        чтобы сохранения и чтение других ключей не ждали большой JSON.
+        """
         cache_file = self.get_cache_file(key)
-        if not cache_file.exists():
-            return None
-        with open(cache_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is not None:
+                self.hits += 1
+                return pending[0]
+            stat = self._file_stat(cache_file)
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[1] == stat:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                # Файл изменился на диске или был удален
+                self._drop_entry(key)
+                self._bump_version(key)
+            self.misses += 1
+            if stat is None:
+                return None
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            # Файл заменили или удалили между stat и open — читаем заново
+            return self.load_data(key)
+        with self._lock:
+            # Пока файл разбирался, ключ могли сохранить — новее то, что в памяти
+            pending = self._pending.get(key)
+            if pending is not None:
+                return pending[0]
+            entry = self._memory.get(key)
+            if entry is not None and entry[1] == self._file_stat(cache_file):
+                return entry[0]
+            # Файл мог измениться во время чтения — тогда не запоминаем
+            if self._file_stat(cache_file) == stat:
+                self._remember(key, data, stat)
+            return data
 
     def save_data(self, key, data):
-        """Сохраняет данные в файл кэша."""
-        with open(self.get_cache_file(key), 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        """Сохраняет данные в кэш; запись в файл выполняется в фоне."""
+        with self._lock:
+            self._generation += 1
+            self._pending[key] = (data, self._generation)
+            self._due.setdefault(key, time.monotonic() + self.write_delay)
+            self._drop_entry(key)
+            self._bump_version(key)
+            self._ensure_writer()
+            self._writer_cond.notify_all()
+
+    def delete_data(self, key):
+        """Удаляет файл кэша и запись в памяти."""
+        cache_file = self.get_cache_file(key)
+        with self._io_lock, self._lock:
+            self._pending.pop(key, None)
+            self._due.pop(key, None)
+            if cache_file.exists():
+                cache_file.unlink()
+            self._drop_entry(key)
+            self._bump_version(key)
+            self._writer_cond.notify_all()
+
+    # ---------- работа с отдельными записями ----------
+    @staticmethod
+    def record_key(record):
+        """Ключ записи: серверный id, а для локальных записей — temp_id."""
+        if not isinstance(record, dict):
+            return None
+        rid = record.get('id')
+        if rid is None:
+            rid = record.get('temp_id')
+        return str(rid) if rid is not None else None
+
+    @staticmethod
+    def normalize_field(field, value):
+        """Приводит значение поля к виду, по которому ищут записи."""
+        if value is None:
+            return None
+        if field in INDEXED_TEXT_FIELDS:
+            return str(value).strip()
+        return value
+
+    def upsert_records(self, key, records):
+        """Добавляет или заменяет записи (по id/temp_id) в списке ключа."""
+        records = [r for r in records if isinstance(r, dict)]
+        if not records:
+            return
+        with self._lock:
+            items = list(self.load_data(key) or [])
+            positions = {self.record_key(it): i for i, it in enumerate(items)}
+            for rec in records:
+                rkey = self.record_key(rec)
+                if rkey is not None and rkey in positions:
+                    items[positions[rkey]] = rec
+                else:
+                    positions[rkey] = len(items)
+                    items.append(rec)
+            self.save_data(key, items)
+            self._log_change(key, upserted=records)
+
+    def delete_records(self, key, record_ids):
+        """Удаляет записи с указанными id/temp_id. Возвращает число удаленных."""
+        ids = {str(r) for r in record_ids if r is not None}
+        if not ids:
+            return 0
+        with self._lock:
+            items = self.load_data(key) or []
+            remaining = [it for it in items if self.record_key(it) not in ids]
+            removed = len(items) - len(remaining)
+            if removed:
+                self.save_data(key, remaining)
+                self._log_change(key, deleted=ids)
+            return removed
+
+    def query_records(self, key, **criteria):
+        """Возвращает записи, у которых поля равны указанным значениям."""
+        wanted = {f: self.normalize_field(f, v) for f, v in criteria.items()}
+        return [
+            it for it in (self.load_data(key) or [])
+            if isinstance(it, dict)
+            and all(self.normalize_field(f, it.get(f)) == v for f, v in wanted.items())
+        ]
 
     def compare_and_update(self, key, new_data):
         """
@@ -35,7 +353,7 @@ class LocalCache:
         Возвращает True, если данные были обновлены.
         """
         old_data = self.load_data(key)
-        
+
         # Простое сравнение словарей
         if old_data != new_data:
             self.save_data(key, new_data)
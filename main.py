@@ -7,7 +7,9 @@ from login import LoginFrame
 from tabs import MainApplicationFrame
 from api_client import APIClient
 from sync_window import SyncWindow
+from sync_scheduler import SyncScheduler
 import requests
+from datetime import datetime
 
 ctk.set_appearance_mode("System")
 ctk.set_default_color_theme("blue")
@@ -18,6 +20,9 @@ ENDPOINTS_TO_SYNC = [
     "unloading-points", "organizations", "customers", "cargo-batches",
 ]
 
+# Хранилище локального кэша: "json" (файл на эндпоинт) или "sqlite"
+CACHE_BACKEND = "json"
+
 class App(ctk.CTk):
     def __init__(self):
         super().__init__()
@@ -29,12 +34,18 @@ class App(ctk.CTk):
         self.geometry(f"{win_width}x{win_height}+{win_x}+{win_y}")
         self.minsize(900, 700)
         
-        self.api_client = APIClient()
+        self.api_client = APIClient(cache_backend=CACHE_BACKEND)
         self.main_app_frame = None
         
         # НОВОЕ: Регистрируем колбэк для обновления UI
         self.api_client.set_data_updated_callback(self.on_data_updated)
         
+        # Автосинхронизация реестра: без наложения запусков, с паузой после ошибок
+        self.sync_scheduler = SyncScheduler(self, self._auto_sync_job, is_active=self._registry_visible)
+        self.sync_scheduler.start()
+        # Окно развернули — реестр снова на экране
+        self.bind("<Map>", lambda event: self.sync_scheduler.poke() if event.widget is self else None)
+
         # Попытка автологина
         success, message = self.api_client.try_auto_login()
         
@@ -42,70 +53,49 @@ class App(ctk.CTk):
             self.show_sync_and_load()
         else:
             self.show_login()
-        
-        
-        #таймер автосинхронизации (каждые 30 секунд)
-        self.auto_sync_interval = 30000  # 30 секунд в миллисекундах
-        self.auto_sync_timer = None
-        self.start_auto_sync()
-
-    def start_auto_sync(self):
-        """Запускает автосинхронизацию реестра"""
-        def auto_sync_worker():
-            if not self.api_client.is_network_ready():
-                return
-            
-            try:
-                # НОВОЕ: Запускаем анимацию кнопки обновления (если она существует)
-                if (hasattr(self, 'main_app_frame') and 
-                    self.main_app_frame and 
-                    hasattr(self.main_app_frame, 'registry_table')):
-                    
-                    table = self.main_app_frame.registry_table
-                    if table.winfo_exists():
-                        self.after(0, table.start_refresh_animation)
-            
-                # НОВОЕ: Обновляем данные текущего пользователя
-                self.api_client.sync_current_user()
-                
-                # Тихая синхронизация только реестра
-                self.api_client.sync_endpoint("registries")
-                
-                # ИЗМЕНЕНО: Обновляем таблицу БЕЗ переключения вкладки
-                if (hasattr(self, 'main_app_frame') and 
-                    self.main_app_frame and 
-                    hasattr(self.main_app_frame, 'registry_table')):
-                    
-                    table = self.main_app_frame.registry_table
-                    if table.winfo_exists():
-                        # Обновляем данные БЕЗ переключения вкладки
-                        self.after(0, table.reload_table_data)
-                        # Останавливаем анимацию
-                        self.after(0, table.stop_refresh_animation)
-                
-                print("-> Автосинхронизация реестра выполнена")
-            except Exception as e:
-                print(f"-> Ошибка автосинхронизации: {e}")
-                # Останавливаем анимацию при ошибке
-                if (hasattr(self, 'main_app_frame') and 
-                    self.main_app_frame and 
-                    hasattr(self.main_app_frame, 'registry_table')):
-                    table = self.main_app_frame.registry_table
-                    if table.winfo_exists():
-                        self.after(0, table.stop_refresh_animation)
-        
-        # Запускаем в фоновом потоке
-        import threading
-        threading.Thread(target=auto_sync_worker, daemon=True).start()
-        
-        # Планируем следующий запуск
-        self.auto_sync_timer = self.after(self.auto_sync_interval, self.start_auto_sync)
 
+    def _registry_table(self):
+        frame = self.main_app_frame
+        if frame and frame.winfo_exists() and hasattr(frame, 'registry_table'):
+            table = frame.registry_table
+            if table.winfo_exists():
+                return table
+        return None
+
+    def _registry_visible(self):
+        """Реестр на экране: окно не свернуто и открыта вкладка «Реестр»."""
+        if self.state() == "iconic" or self._registry_table() is None:
+            return False
+        return self.main_app_frame.tab_view.get() == "Реестр"
+
+    def _auto_sync_job(self):
+        """Тихая синхронизация реестра (рабочий поток SyncScheduler). Возвращает (ok, changed)."""
+        if not self.api_client.is_network_ready():
+            return None, False
+
+        table = self._registry_table()
+        if table is not None:
+            self.after(0, table.start_refresh_animation)
+        try:
+            version = self.api_client.cache.get_version("registries")
+            # Обновляем данные текущего пользователя
+            self.api_client.sync_current_user()
+            ok = self.api_client.sync_endpoint("registries")
+            changed = self.api_client.cache.get_version("registries") != version
+            if changed and table is not None:
+                # Обновляем данные БЕЗ переключения вкладки
+                self.after(0, table.reload_table_data)
+            print(f"-> Автосинхронизация реестра: {'выполнена' if ok else 'ошибка'}")
+            return ok, changed
+        finally:
+            if table is not None:
+                self.after(0, table.stop_refresh_animation)
 
     def destroy(self):
-        """Отменяем таймер при закрытии приложения"""
-        if self.auto_sync_timer:
-            self.after_cancel(self.auto_sync_timer)
+        """Останавливаем автосинхронизацию при закрытии приложения"""
+        self.sync_scheduler.stop()
+        # Дописываем отложенные сохранения кэша на диск
+        self.api_client.cache.flush(timeout=10)
         super().destroy()
             
     def on_data_updated(self):
@@ -133,6 +123,12 @@ class App(ctk.CTk):
             messagebox.showerror("Ошибка авторизации", message)
 
     def show_sync_and_load(self):
+        if self.api_client.has_warm_cache(ENDPOINTS_TO_SYNC):
+            # Кэш от прошлой синхронизации: окно сразу, обновление в фоне
+            self.show_main_app()
+            self.refresh_in_background()
+            return
+
         for widget in self.winfo_children():
             widget.destroy()
         
@@ -141,11 +137,13 @@ class App(ctk.CTk):
         def sync_data():
             sync_window.update_progress("Загрузка справочников...")
             
-            # Параллельная синхронизация справочников
-            self.api_client.sync_all_parallel(
+            # Параллельная синхронизация справочников; свежие по TTL не запрашиваются,
+            # но после смены пользователя загружаются заново
+            results = self.api_client.sync_all_parallel(
                 ENDPOINTS_TO_SYNC, 
                 progress_callback=sync_window.update_progress,
-                max_workers=6
+                max_workers=6,
+                force=self.api_client.get_sync_state().get('user') != self.api_client.current_user
             )
             
             # НОВОЕ: Загружаем данные текущего пользователя
@@ -153,7 +151,10 @@ class App(ctk.CTk):
             self.api_client.sync_current_user()
             
             sync_window.update_progress("Загрузка реестра...")
-            self.api_client.sync_endpoint("registries", progress_callback=sync_window.update_progress)
+            registry_ok = self.api_client.sync_endpoint("registries", progress_callback=sync_window.update_progress)
+            # Время синхронизации отмечается, только если обновились и справочники
+            if registry_ok and all(results.values()):
+                self.api_client.mark_full_sync()
             
             sync_window.update_progress("Синхронизация завершена.")
             sync_window.finish()
@@ -161,6 +162,40 @@ class App(ctk.CTk):
         
         threading.Thread(target=sync_data, daemon=True).start()
 
+    def _freshness_text(self):
+        synced_at = self.api_client.get_sync_state().get('synced_at')
+        try:
+            return f"Данные от {datetime.fromisoformat(synced_at).strftime('%d.%m.%Y %H:%M')}"
+        except (TypeError, ValueError):
+            return "Данные из кэша"
+
+    def set_sync_status(self, text):
+        if self.main_app_frame and self.main_app_frame.winfo_exists():
+            self.main_app_frame.set_sync_status(text)
+
+    def refresh_in_background(self):
+        """Обновляет справочники, пользователя и реестр без модального окна."""
+        self.set_sync_status(f"{self._freshness_text()} · обновление...")
+
+        def worker():
+            results = self.api_client.sync_all_parallel(ENDPOINTS_TO_SYNC, max_workers=6)
+            self.api_client.sync_current_user()
+            registry_ok = self.api_client.sync_endpoint("registries")
+            ok = registry_ok and all(results.values())
+            if ok:
+                self.api_client.mark_full_sync()
+
+            def done():
+                if self.main_app_frame and self.main_app_frame.winfo_exists():
+                    self.main_app_frame.reload_all_tables()
+                    text = self._freshness_text()
+                    if not ok:
+                        text += " · не удалось обновить, нет связи с сервером"
+                    self.set_sync_status(text)
+            self.after(0, done)
+
+        threading.Thread(target=worker, daemon=True).start()
+
 
     def show_main_app(self):
         for widget in self.winfo_children():
@@ -170,21 +205,25 @@ class App(ctk.CTk):
             self, 
             self.api_client, 
             on_logout_callback=self.show_login, 
-            sync_callback=self.resync_data
+            sync_callback=self.resync_data,
+            sync_scheduler=self.sync_scheduler
         )
         self.main_app_frame.pack(fill="both", expand=True)
+        self.set_sync_status(self._freshness_text())
 
-    def resync_data(self):
+    def resync_data(self, force=False):
+        """Синхронизация по кнопке; force=True — справочники загружаются заново без учета TTL."""
         sync_window = SyncWindow(self, total_steps=3)
         
         def sync_worker():
             try:
                 sync_window.update_progress("Обновление справочников...")
                 
-                self.api_client.sync_all_parallel(
+                results = self.api_client.sync_all_parallel(
                     ENDPOINTS_TO_SYNC, 
                     progress_callback=sync_window.update_progress,
-                    max_workers=6
+                    max_workers=6,
+                    force=force
                 )
                 
                 # НОВОЕ: Обновляем данные текущего пользователя
@@ -192,13 +231,24 @@ class App(ctk.CTk):
                 self.api_client.sync_current_user()
                 
                 sync_window.update_progress("Отправка локальных изменений...")
-                self.api_client.sync_pending_registries(progress_callback=sync_window.update_progress)
+                _, _, synced = self.api_client.sync_pending_registries(
+                    progress_callback=sync_window.update_progress,
+                    counts_callback=sync_window.update_counts
+                )
                 
-                sync_window.update_progress("Синхронизация завершена.")
+                # Время синхронизации отмечается, только если все действительно обновилось
+                ok = synced and all(results.values())
+                if ok:
+                    self.api_client.mark_full_sync()
+                sync_window.update_progress("Синхронизация завершена." if ok else "Синхронизация завершена с ошибками.")
                 sync_window.finish()
                 
                 if self.main_app_frame:
+                    text = self._freshness_text()
+                    if not ok:
+                        text += " · не удалось обновить, нет связи с сервером"
                     self.after(0, self.main_app_frame.reload_all_tables)
+                    self.after(0, lambda: self.set_sync_status(text))
             except Exception as e:
                 sync_window.finish()
                 self.after(0, lambda: messagebox.showerror("Ошибка", f"Ошибка синхронизации: {e}"))
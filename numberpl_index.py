@@ -0,0 +1,115 @@
+# numberpl_index.py
+
+import threading
+
+
+def normalize_number(value):
+    return str(value if value is not None else '').strip()
+
+
+class NumberPLIndex:
+    """
+    Индекс «номер ПЛ → записи» по реестру сервера, очереди и конфликтам.
+
+    Перестраивается только при смене версии кэша реестра или журнала очереди,
+    поэтому проверка конфликтов не перечитывает и не перебирает весь реестр.
+    """
+    def __init__(self, cache, journal, endpoint="registries"):
+        self.cache = cache
+        self.journal = journal
+        self.endpoint = endpoint
+        self._lock = threading.Lock()
+        self._server_version = None
+        self._queue_version = None
+        self.server = {}
+        self.pending = {}
+        self.conflicts = {}
+
+    @staticmethod
+    def _build(items, require_id=False):
+        index = {}
+        for item in items or []:
+            if not isinstance(item, dict):
+                continue
+            if require_id and 'id' not in item:
+                continue
+            number = normalize_number(item.get('numberPL'))
+            if number:
+                index.setdefault(number, []).append(item)
+        return index
+
+    def _ensure_fresh(self):
+        server_version = self.cache.get_version(self.endpoint)
+        if server_version != self._server_version:
+            self.server = self._build(self.cache.load_data(self.endpoint), require_id=True)
+            self._server_version = server_version
+        queue_version = self.journal.version
+        if queue_version != self._queue_version:
+            self.pending = self._build(self.journal.pending_items())
+            self.conflicts = self._build(self.journal.conflict_items())
+            self._queue_version = queue_version
+
+    def _server_conflict(self, item):
+        number = normalize_number(item.get('numberPL'))
+        if not number:
+            return None
+        driver = item.get('driver')
+        for server_item in self.server.get(number, []):
+            if driver != server_item.get('driver'):
+                return f"Номер ПЛ {number} уже существует с другим водителем"
+        return None
+
+    def _unresolved_conflict(self, item):
+        # Пока конфликт не разрешен, его номер ПЛ не занимает другая запись
+        number = normalize_number(item.get('numberPL'))
+        if not number:
+            return None
+        temp_id = item.get('temp_id')
+        for conflict in self.conflicts.get(number, []):
+            if conflict.get('temp_id') != temp_id:
+                return f"Номер ПЛ {number} совпадает с неразрешенным конфликтом"
+        return None
+
+    def _queue_conflict(self, item):
+        # Как в check_queue: из записей очереди с одним номером отправляется первая
+        number = normalize_number(item.get('numberPL'))
+        if not number:
+            return None
+        queued = self.pending.get(number)
+        if not queued or queued[0].get('temp_id') == item.get('temp_id'):
+            return None
+        return f"Номер ПЛ {number} повторяется в очереди отправки"
+
+    def check(self, item):
+        """
+        Конфликт локальной записи с реестром сервера, неразрешенным конфликтом
+        или более ранней записью очереди (или None).
+        """
+        with self._lock:
+            self._ensure_fresh()
+            return (self._server_conflict(item) or self._unresolved_conflict(item)
+                    or self._queue_conflict(item))
+
+    def check_queue(self, items):
+        """
+        Проверяет всю очередь за один проход: конфликты с сервером, совпадения
+        с неразрешенными конфликтами и повторы номера ПЛ внутри самой очереди
+        (первая запись остается, остальные — конфликт). Возвращает {temp_id: причина}.
+        """
+        result = {}
+        seen = {}
+        with self._lock:
+            self._ensure_fresh()
+            for item in items:
+                if not isinstance(item, dict):
+                    continue
+                temp_id = item.get('temp_id')
+                reason = self._server_conflict(item) or self._unresolved_conflict(item)
+                number = normalize_number(item.get('numberPL'))
+                if not reason and number:
+                    first = seen.setdefault(number, temp_id)
+                    if first != temp_id:
+                        reason = f"Номер ПЛ {number} повторяется в очереди отправки"
+                if reason:
+                    result[temp_id] = reason
+        return result
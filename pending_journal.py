@@ -0,0 +1,171 @@
+# pending_journal.py
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from data_cache import LocalCache
+
+
+class PendingJournal:
+    """
+    Очередь неотправленных записей (и конфликтов) в виде журнала событий.
+
+    Каждое изменение дописывается одной строкой в cache/pending_<endpoint>.journal:
+    enqueue / sent / conflict / resolved. Текущее состояние хранится в памяти,
+    при запуске восстанавливается повторным проигрыванием журнала. Периодически
+    журнал сжимается в одну строку snapshot.
+    """
+    def __init__(self, cache, endpoint="registries", compact_every=200):
+        self.cache = cache
+        self.endpoint = endpoint
+        self.compact_every = compact_every
+        self.path = cache.cache_dir / f"pending_{endpoint}.journal"
+        self.pending = OrderedDict()
+        self.conflicts = OrderedDict()
+        self.version = 0
+        self._events_since_snapshot = 0
+        self._lock = threading.RLock()
+        self._fh = None
+
+        if self.path.exists():
+            self._replay()
+        else:
+            self._import_legacy()
+        if self._events_since_snapshot:
+            self.compact()
+
+    # ---------- восстановление ----------
+    def _apply(self, event):
+        op = event.get('op')
+        if op == 'snapshot':
+            self.pending.clear()
+            self.conflicts.clear()
+            for item in event.get('pending') or []:
+                self._put(self.pending, item)
+            for item in event.get('conflicts') or []:
+                self._put(self.conflicts, item)
+        elif op == 'enqueue':
+            self._put(self.pending, event.get('item'))
+        elif op == 'sent':
+            self.pending.pop(event.get('temp_id'), None)
+        elif op == 'conflict':
+            item = event.get('item') or {}
+            self.pending.pop(item.get('temp_id'), None)
+            self._put(self.conflicts, item)
+        elif op == 'resolved':
+            self.conflicts.pop(event.get('temp_id'), None)
+
+    @staticmethod
+    def _put(target, item):
+        if isinstance(item, dict) and item.get('temp_id'):
+            target[item['temp_id']] = item
+
+    def _replay(self):
+        """Проигрывает журнал; оборванная последняя строка (сбой при записи) отбрасывается."""
+        good_size = 0
+        with open(self.path, 'rb') as f:
+            for raw in f:
+                try:
+                    event = json.loads(raw.decode('utf-8'))
+                except (UnicodeDecodeError, ValueError):
+                    print(f"-> Журнал {self.path.name}: поврежденная запись отброшена")
+                    break
+                self._apply(event)
+                good_size += len(raw)
+                self._events_since_snapshot += 0 if event.get('op') == 'snapshot' else 1
+        if good_size != self.path.stat().st_size:
+            with open(self.path, 'r+b') as f:
+                f.truncate(good_size)
+            self._events_since_snapshot += 1
+
+    def _import_legacy(self):
+        """Однократно переносит старые pending_/conflict_ списки из кэша в журнал."""
+        for key, target in ((f"pending_{self.endpoint}", self.pending), (f"conflict_{self.endpoint}", self.conflicts)):
+            data = self.cache.load_data(key)
+            if isinstance(data, list):
+                for item in data:
+                    self._put(target, item)
+        self.compact()
+        self.cache.delete_data(f"pending_{self.endpoint}")
+        self.cache.delete_data(f"conflict_{self.endpoint}")
+
+    # ---------- запись ----------
+    def _append(self, event):
+        line = json.dumps(event, ensure_ascii=False, separators=(',', ':')) + "\n"
+        if self._fh is None:
+            self._fh = open(self.path, 'a', encoding='utf-8')
+        self._fh.write(line)
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self._apply(event)
+        self.version += 1
+        self._events_since_snapshot += 1
+        if self._events_since_snapshot >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        """Заменяет журнал одной строкой snapshot с текущим состоянием."""
+        with self._lock:
+            snapshot = {
+                'op': 'snapshot',
+                'pending': list(self.pending.values()),
+                'conflicts': list(self.conflicts.values()),
+            }
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps(snapshot, ensure_ascii=False, separators=(',', ':')) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self._events_since_snapshot = 0
+            self.version += 1
+
+    def enqueue(self, item):
+        with self._lock:
+            self._append({'op': 'enqueue', 'item': item})
+
+    def mark_sent(self, temp_id):
+        with self._lock:
+            if temp_id in self.pending:
+                self._append({'op': 'sent', 'temp_id': temp_id})
+
+    def mark_conflict(self, item, reason):
+        with self._lock:
+            item = dict(item, conflict_reason=reason)
+            self._append({'op': 'conflict', 'item': item})
+
+    def resolve(self, temp_id):
+        with self._lock:
+            if temp_id in self.conflicts:
+                self._append({'op': 'resolved', 'temp_id': temp_id})
+
+    # ---------- чтение ----------
+    def get(self, temp_id):
+        with self._lock:
+            return self.pending.get(temp_id)
+
+    def pending_items(self):
+        with self._lock:
+            return list(self.pending.values())
+
+    def conflict_items(self):
+        with self._lock:
+            return list(self.conflicts.values())
+
+    def query(self, **criteria):
+        """Записи очереди, у которых поля равны указанным значениям."""
+        wanted = {f: LocalCache.normalize_field(f, v) for f, v in criteria.items()}
+        return [
+            it for it in self.pending_items()
+            if all(LocalCache.normalize_field(f, it.get(f)) == v for f, v in wanted.items())
+        ]
+
+    def close(self):
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
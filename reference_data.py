@@ -0,0 +1,134 @@
+# reference_data.py
+
+import threading
+from types import MappingProxyType
+
+# Справочники, общие для таблиц, формы ПЛ и карточки реестра
+REFERENCE_ENDPOINTS = (
+    'seasons', 'organizations', 'customers', 'gruzes', 'cargo-batches',
+    'drivers', 'cars', 'podryads', 'loading-points', 'unloading-points',
+    'car-markas', 'car-models',
+)
+
+# Поле, которое показывается вместо id (по умолчанию — 'name')
+NAME_FIELDS = {
+    'drivers': 'full_name',
+    'cars': 'number',
+    'podryads': 'org_name',
+    'cargo-batches': 'batch_number',
+}
+
+EMPTY_MAP = MappingProxyType({})
+
+
+def name_field(endpoint):
+    return NAME_FIELDS.get(endpoint, 'name')
+
+
+class _EndpointData:
+    """Готовые структуры одного справочника (собираются один раз на версию кэша)."""
+    def __init__(self, endpoint, version, raw):
+        self.version = version
+        self.items = tuple(it for it in (raw or []) if isinstance(it, dict))
+        by_id = {}
+        name_to_id = {}
+        field = name_field(endpoint)
+        for it in self.items:
+            item_id = it.get('id')
+            if item_id is None:
+                continue
+            by_id.setdefault(item_id, it)
+            name = it.get(field)
+            if name:
+                # Как и при выборе из списка — побеждает первая запись с таким названием
+                name_to_id.setdefault(name, item_id)
+        self.by_id = MappingProxyType(by_id)
+        self.name_to_id = MappingProxyType(name_to_id)
+
+
+def _driver_contractor_index(podryads):
+    """Водитель → подрядчик по спискам drivers у подрядчиков."""
+    index = {}
+    for podryad in podryads:
+        drivers = podryad.get('drivers', [])
+        if not isinstance(drivers, list):
+            continue
+        for item in drivers:
+            if isinstance(item, dict):
+                driver_id = item.get('id')
+            elif isinstance(item, int):
+                driver_id = item
+            else:
+                driver_id = None
+            if driver_id:
+                index[driver_id] = podryad.get('id')
+    return MappingProxyType(index)
+
+
+class ReferenceSnapshot:
+    """
+    Неизменяемый снимок справочников: списки записей, словари id → запись,
+    название → id и индекс водитель → подрядчик. Снимок не меняется после
+    создания, поэтому его можно читать из любого потока; при обновлении
+    справочников ReferenceDataStore выдает новый снимок.
+    """
+    def __init__(self, parts, driver_to_podryad):
+        self._parts = parts
+        self.version = tuple((e, p.version) for e, p in sorted(parts.items()))
+        self.lists = MappingProxyType({e: p.items for e, p in parts.items()})
+        self.by_id = MappingProxyType({e: p.by_id for e, p in parts.items()})
+        self.name_to_id = MappingProxyType({e: p.name_to_id for e, p in parts.items()})
+        self.driver_to_podryad = driver_to_podryad
+
+    def items(self, endpoint):
+        return self.lists.get(endpoint, ())
+
+    def get(self, endpoint, item_id):
+        return self.by_id.get(endpoint, EMPTY_MAP).get(item_id)
+
+    def name(self, endpoint, item_id, default=""):
+        item = self.get(endpoint, item_id)
+        if item is None:
+            return default
+        return item.get(name_field(endpoint), default)
+
+    def id_by_name(self, endpoint, name):
+        if not name:
+            return None
+        return self.name_to_id.get(endpoint, EMPTY_MAP).get(name)
+
+
+class ReferenceDataStore:
+    """
+    Общее для всего приложения хранилище справочников.
+
+    snapshot() сверяет версии кэша по каждому справочнику и пересобирает
+    только изменившиеся; если ничего не менялось, возвращается тот же
+    объект снимка — по нему виджеты понимают, что перестраивать нечего.
+    """
+    def __init__(self, cache, endpoints=REFERENCE_ENDPOINTS):
+        self.cache = cache
+        self.endpoints = tuple(endpoints)
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def snapshot(self):
+        with self._lock:
+            parts = dict(self._snapshot._parts) if self._snapshot is not None else {}
+            changed = []
+            for endpoint in self.endpoints:
+                version = self.cache.get_version(endpoint)
+                current = parts.get(endpoint)
+                if current is None or current.version != version:
+                    parts[endpoint] = _EndpointData(endpoint, version, self.cache.load_data(endpoint))
+                    changed.append(endpoint)
+            if self._snapshot is not None and not changed:
+                return self._snapshot
+            if self._snapshot is None or 'podryads' in changed:
+                podryads = parts.get('podryads')
+                driver_to_podryad = _driver_contractor_index(podryads.items if podryads else ())
+            else:
+                driver_to_podryad = self._snapshot.driver_to_podryad
+            print(f"-> Справочники обновлены: {', '.join(changed)}")
+            self._snapshot = ReferenceSnapshot(parts, driver_to_podryad)
+            return self._snapshot
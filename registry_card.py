@@ -35,18 +35,10 @@ class RegistryCardWindow(ctk.CTkToplevel):
         self.fields = {}
         self.field_order = []
 
-        self.related = {
-            "drivers": api_client.get_local_data('drivers') or [],
-            "cars": api_client.get_local_data('cars') or [],
-            "podryads": api_client.get_local_data('podryads') or [],
-            "gruzes": api_client.get_local_data('gruzes') or [],
-        }
-        self.by_id = {
-            "drivers": {d.get('id'): d for d in self.related['drivers'] if isinstance(d, dict)},
-            "cars": {c.get('id'): c for c in self.related['cars'] if isinstance(c, dict)},
-            "podryads": {p.get('id'): p for p in self.related['podryads'] if isinstance(p, dict)},
-            "gruzes": {g.get('id'): g for g in self.related['gruzes'] if isinstance(g, dict)},
-        }
+        # Общий снимок справочников: списки и словари по id уже собраны
+        self.reference = api_client.get_reference_data()
+        self.related = self.reference.lists
+        self.by_id = self.reference.by_id
 
         self.content = ctk.CTkScrollableFrame(self, fg_color="transparent")
         self.content.pack(fill="both", expand=True, padx=12, pady=12)
@@ -229,12 +221,8 @@ class RegistryCardWindow(ctk.CTkToplevel):
         payload = {}
 
         def get_id_by_name(rel_key, name_field, name_value):
-            if not name_value:
-                return None
-            for item in self.related[rel_key]:
-                if item.get(name_field) == name_value:
-                    return item.get('id')
-            return None
+            # name_field совпадает с полем названия справочника в reference_data
+            return self.reference.id_by_name(rel_key, name_value)
 
         def read_entry(key):
             w = self.fields.get(key)
@@ -0,0 +1,66 @@
+# registry_export.py
+# Выгрузка строк таблицы в XLSX (потоковая запись openpyxl) или CSV
+
+import csv
+from pathlib import Path
+from openpyxl import Workbook
+
+# Как часто сообщать о ходе выгрузки (в строках)
+PROGRESS_EVERY = 500
+# Ограничения Excel на имя листа
+SHEET_TITLE_MAX = 31
+SHEET_TITLE_FORBIDDEN = '[]:*?/\\'
+
+
+def _cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, (str, int, float)):
+        return value
+    return str(value)
+
+
+def _sheet_title(title):
+    title = "".join(" " if ch in SHEET_TITLE_FORBIDDEN else ch for ch in str(title or "")).strip(" '")
+    return title[:SHEET_TITLE_MAX] or "Лист1"
+
+
+def export_rows(path, headers, rows, total=None, progress_callback=None, title="Реестр"):
+    """
+    Записывает заголовок и строки в файл path (.xlsx или .csv).
+    title — имя листа XLSX (недопустимые для Excel символы заменяются).
+
+    rows — итерируемый объект (лучше генератор): строки формируются и
+    пишутся по одной, поэтому память не растет с размером выгрузки.
+    progress_callback(done, total) вызывается каждые PROGRESS_EVERY строк
+    и в конце. Возвращает число записанных строк.
+    """
+    path = Path(path)
+    done = 0
+
+    def report():
+        if progress_callback:
+            progress_callback(done, total)
+
+    if path.suffix.lower() == ".csv":
+        # utf-8-sig и «;» — чтобы файл корректно открывался в русском Excel
+        with open(path, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.writer(f, delimiter=";")
+            writer.writerow(headers)
+            for row in rows:
+                writer.writerow([_cell(v) for v in row])
+                done += 1
+                if done % PROGRESS_EVERY == 0:
+                    report()
+    else:
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(_sheet_title(title))
+        ws.append(list(headers))
+        for row in rows:
+            ws.append([_cell(v) for v in row])
+            done += 1
+            if done % PROGRESS_EVERY == 0:
+                report()
+        wb.save(path)
+    report()
+    return done
@@ -0,0 +1,245 @@
+# registry_view.py
+
+import threading
+from bisect import bisect_left
+from collections import ChainMap, deque
+
+from data_cache import CHANGE_LOG_LIMIT
+
+
+class RegistryViewModel:
+    """
+    Объединенный вид реестра: записи сервера, очереди отправки и конфликты.
+
+    Порядок — серверные записи по убыванию id (записи без id — после них),
+    затем очередь и конфликты. Держит словари по id, temp_id и ключу строки
+    таблицы и множества temp_id очереди/конфликтов, так что поиск записи
+    по строке таблицы и проверка ее состояния — O(1).
+
+    refresh() сверяет версии кэша реестра и журнала очереди. Изменения
+    реестра применяются точечно по changes_since кэша (вставка на место
+    по id двоичным поиском, замена, удаление); полная пересборка — только
+    после полной загрузки реестра. Очередь (обычно десятки записей)
+    пересобирается целиком и не трогает серверную часть.
+
+    version растет при каждом изменении вида; changes_since отдает записи,
+    изменившиеся после данной версии, — по ним производные структуры
+    (итоги под таблицей) обновляются без пересборки.
+    """
+    def __init__(self, api_client, endpoint="registries"):
+        self.api_client = api_client
+        self.endpoint = endpoint
+        self._lock = threading.Lock()
+        self._server_version = None
+        self._queue_version = None
+        self.version = 0
+        # (версия, ключи строк, изменившиеся в ней); история полна после _log_start
+        self._changes = deque(maxlen=CHANGE_LOG_LIMIT)
+        self._log_start = 0
+
+        # server_items: сначала записи с id (по убыванию), затем без id;
+        # _order — их -id по возрастанию, для двоичного поиска позиции
+        self.server_items = []
+        self._order = []
+        self.by_id = {}
+        self._server_by_iid = {}
+        self.queue_items = []
+        self.by_temp_id = {}
+        self._queue_by_iid = {}
+        self.pending_temp_ids = set()
+        self.conflict_temp_ids = set()
+        self.items = []
+        # Серверная запись важнее записи очереди с тем же ключом
+        self.by_iid = ChainMap(self._server_by_iid, self._queue_by_iid)
+
+    @staticmethod
+    def iid_for(item):
+        """Ключ строки таблицы: id, а для неотправленных записей — temp_id."""
+        item_id = item.get('id') or item.get('temp_id')
+        return str(item_id) if item_id is not None else None
+
+    def refresh(self):
+        """Подтягивает изменения кэша и очереди. Возвращает True, если вид изменился."""
+        with self._lock:
+            cache = self.api_client.cache
+            journal = self.api_client.get_pending_journal(self.endpoint)
+            server_version = cache.get_version(self.endpoint)
+            queue_version = journal.version
+            server_changed = server_version != self._server_version
+            queue_changed = queue_version != self._queue_version
+            if not (server_changed or queue_changed):
+                return False
+            changed = set(self._queue_by_iid)
+            full = False
+            if server_changed:
+                changes = cache.changes_since(self.endpoint, self._server_version)
+                if changes is None or not self._apply_server_changes(*changes, changed):
+                    self._rebuild_server(cache.load_data(self.endpoint) or [])
+                    full = True
+                self._server_version = server_version
+            # Очередь сверяется с серверными id, поэтому пересобирается и при их изменении
+            self._rebuild_queue(journal.pending_items(), journal.conflict_items())
+            self._queue_version = queue_version
+            # Новый список, а не изменение старого: его может читать фоновая фильтрация
+            self.items = self.server_items + self.queue_items
+            self.version += 1
+            if full:
+                self._changes.clear()
+                self._log_start = self.version
+            else:
+                changed.update(self._queue_by_iid)
+                if len(self._changes) == self._changes.maxlen:
+                    self._log_start = self._changes[0][0]
+                self._changes.append((self.version, frozenset(changed)))
+            return True
+
+    def changes_since(self, version):
+        """
+        (версия, изменившиеся записи, ключи удаленных) после версии version
+        или None, если история изменений с нее не сохранилась. Версия и
+        изменения читаются вместе, под той же блокировкой, что и refresh.
+        """
+        with self._lock:
+            if version == self.version:
+                return self.version, [], set()
+            if version is None or not self._log_start <= version < self.version:
+                return None
+            keys = set()
+            for entry_version, changed in self._changes:
+                if entry_version > version:
+                    keys |= changed
+            upserted, deleted = [], set()
+            for key in keys:
+                item = self.by_iid.get(key)
+                if item is None:
+                    deleted.add(key)
+                else:
+                    upserted.append(item)
+            return self.version, upserted, deleted
+
+    def snapshot(self):
+        """(версия, записи) — согласованная пара для полной пересборки."""
+        with self._lock:
+            return self.version, self.items
+
+    # ---------- серверная часть ----------
+    def _rebuild_server(self, server_items):
+        by_id = {}
+        without_id = []
+        for item in server_items:
+            if not isinstance(item, dict):
+                continue
+            if item.get('id') is None:
+                without_id.append(item)
+            else:
+                by_id.setdefault(item['id'], item)
+        # Новые сверху
+        order = sorted(by_id, reverse=True)
+        self.by_id = by_id
+        self._order = [-item_id for item_id in order]
+        self.server_items = [by_id[item_id] for item_id in order] + without_id
+        self._server_by_iid.clear()
+        for item in self.server_items:
+            iid = self.iid_for(item)
+            if iid is not None:
+                self._server_by_iid.setdefault(iid, item)
+
+    def _apply_server_changes(self, upserted, deleted, changed):
+        """
+        Точечно применяет изменения кэша, добавляя ключи затронутых строк
+        в changed. False — изменения касаются записей без id (их место
+        в списке не определить), нужна полная пересборка.
+        """
+        if any(not isinstance(item.get('id'), int) for item in upserted):
+            return False
+        has_unkeyed = len(self.server_items) > len(self._order)
+        deleted_ids = set()
+        for key in deleted:
+            item_id = self._id_for_key(key)
+            if item_id is not None:
+                deleted_ids.add(item_id)
+            elif has_unkeyed:
+                # Возможно, удалена запись без id — ее позиция не известна
+                return False
+        for item_id in deleted_ids:
+            pos = bisect_left(self._order, -item_id)
+            del self._order[pos]
+            del self.server_items[pos]
+            old = self.by_id.pop(item_id)
+            self._server_by_iid.pop(self.iid_for(old), None)
+            changed.add(self.iid_for(old))
+        for item in upserted:
+            item_id = item['id']
+            pos = bisect_left(self._order, -item_id)
+            old = self.by_id.get(item_id)
+            if old is not None:
+                self.server_items[pos] = item
+                self._server_by_iid.pop(self.iid_for(old), None)
+            else:
+                self._order.insert(pos, -item_id)
+                self.server_items.insert(pos, item)
+            self.by_id[item_id] = item
+            self._server_by_iid[self.iid_for(item)] = item
+            changed.add(self.iid_for(item))
+        return True
+
+    def _id_for_key(self, key):
+        """id серверной записи по ключу кэша (str(id)) или None."""
+        try:
+            item_id = int(key)
+        except (TypeError, ValueError):
+            return None
+        return item_id if item_id in self.by_id else None
+
+    # ---------- очередь ----------
+    def _rebuild_queue(self, pending_items, conflict_items):
+        queue_items = []
+        by_temp_id = {}
+        pending_ids = set()
+        conflict_ids = set()
+        for p in pending_items:
+            if not isinstance(p, dict):
+                continue
+            if p.get('temp_id'):
+                pending_ids.add(p['temp_id'])
+            if p.get('id') is not None and p.get('id') in self.by_id:
+                continue
+            queue_items.append(p)
+            by_temp_id.setdefault(p.get('temp_id'), p)
+        for c in conflict_items:
+            if not isinstance(c, dict):
+                continue
+            if c.get('temp_id'):
+                conflict_ids.add(c['temp_id'])
+            if c.get('id') is not None and c.get('id') in self.by_id:
+                continue
+            if c.get('temp_id') in by_temp_id:
+                continue
+            queue_items.append(c)
+            by_temp_id.setdefault(c.get('temp_id'), c)
+        self.queue_items = queue_items
+        self.by_temp_id = by_temp_id
+        self._queue_by_iid.clear()
+        for item in queue_items:
+            iid = self.iid_for(item)
+            if iid is not None:
+                self._queue_by_iid.setdefault(iid, item)
+        self.pending_temp_ids = pending_ids
+        self.conflict_temp_ids = conflict_ids
+
+    # ---------- чтение ----------
+    def get(self, iid):
+        """Запись по ключу строки таблицы (id или temp_id) или None."""
+        return self.by_iid.get(str(iid))
+
+    def status(self, item):
+        """'conflict', 'pending' или None — состояние отправки записи."""
+        temp_id = item.get('temp_id')
+        if temp_id in self.conflict_temp_ids:
+            return 'conflict'
+        if temp_id in self.pending_temp_ids:
+            return 'pending'
+        return None
+
+    def pending_count(self):
+        return len(self.pending_temp_ids) + len(self.conflict_temp_ids)
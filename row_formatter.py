@@ -0,0 +1,126 @@
+# row_formatter.py
+
+from datetime import datetime
+from functools import lru_cache
+
+DATETIME_FIELDS = ('dataPOPL', 'dataSDPL', 'loading_time', 'unloading_time', 'approved_at')
+
+# Английские статусы → русский текст
+STATUS_LABELS = {
+    'draft': 'Черновик',
+    'pending': 'На рассмотрении',
+    'approved': 'Одобрено',
+    'rejected': 'Отклонено',
+    'active': 'Активен',
+    'inactive': 'Неактивен',
+}
+
+# Поле → (справочник, поле названия)
+LOOKUP_FIELDS = {
+    'driver': ('drivers', 'full_name'),
+    'driver2': ('drivers', 'full_name'),
+    'number': ('cars', 'number'),
+    'pod': ('podryads', 'org_name'),
+    'contractor': ('podryads', 'org_name'),
+    'gruz': ('gruzes', 'name'),
+    'marka': ('car-markas', 'name'),
+    'model': ('car-models', 'name'),
+}
+
+# Больше строк в кэше не держим — он просто очищается
+ROW_CACHE_LIMIT = 200000
+
+
+@lru_cache(maxsize=65536)
+def _format_iso(iso_str):
+    try:
+        dt = datetime.fromisoformat(iso_str.replace("Z", "+00:00")) if "Z" in iso_str else datetime.fromisoformat(iso_str)
+        return dt.strftime("%d.%m.%Y %H:%M")
+    except ValueError:
+        return iso_str
+
+
+def format_datetime(iso_str):
+    """Форматирует ISO datetime в 'ДД.ММ.ГГГГ ЧЧ:ММ'"""
+    if not iso_str:
+        return ""
+    if isinstance(iso_str, str):
+        return _format_iso(iso_str)
+    return str(iso_str)
+
+
+class RowFormatter:
+    """
+    Форматирует значения строк таблицы для вывода.
+
+    Для каждой колонки один раз подбирается функция форматирования
+    (дата, название из справочника, статус и т.д.), поэтому при выводе нет
+    цепочки проверок по имени поля. Готовые строки кэшируются по ключу
+    записи вместе с исходными значениями колонок: пока они не изменились,
+    запись повторно не форматируется. Справочники и данные пользователя
+    фиксируются при создании — после их обновления нужен новый RowFormatter.
+    """
+    def __init__(self, columns, related_data, current_user_info=None):
+        self.columns = list(columns)
+        self.related_data = related_data
+        self.current_user_id, self.current_user_name = self._user_display(current_user_info)
+        self._formatters = [self._compile(field) for field in self.columns]
+        self._rows = {}
+
+    @staticmethod
+    def _user_display(info):
+        if not info:
+            return None, None
+        first_name = (info.get('first_name') or '').strip()
+        last_name = (info.get('last_name') or '').strip()
+        username = (info.get('username') or '').strip()
+        full_name = ' '.join(filter(None, [first_name, last_name]))
+        return info.get('id'), full_name or username or None
+
+    def _compile(self, field):
+        if field == 'created_by':
+            def fmt(value):
+                if self.current_user_id is not None and value == self.current_user_id:
+                    return self.current_user_name or str(value)
+                # Другой пользователь (не текущий)
+                return f"User #{value}"
+            return fmt
+        if field in DATETIME_FIELDS:
+            return format_datetime
+        if field in LOOKUP_FIELDS:
+            endpoint, name_field = LOOKUP_FIELDS[field]
+            refs = self.related_data.get(endpoint, {})
+
+            def fmt(value):
+                ref = refs.get(value)
+                return ref.get(name_field, value) if ref is not None else value
+            return fmt
+        if field == 'status':
+            return lambda value: STATUS_LABELS.get(str(value).lower(), value)
+        if field == 'cars':
+            cars = self.related_data.get('cars', {})
+
+            def fmt(value):
+                # Список ТС (для водителей)
+                if not isinstance(value, list):
+                    return value
+                return ', '.join(cars[cid].get('number', '') for cid in value if cid in cars)
+            return fmt
+        return None
+
+    def format(self, item, key=None):
+        """Значения колонок записи для вывода. key — ключ записи для кэша."""
+        raw = tuple(item.get(field) for field in self.columns)
+        if key is not None:
+            cached = self._rows.get(key)
+            if cached is not None and cached[0] == raw:
+                return cached[1]
+        values = [
+            "" if value is None else (fmt(value) if fmt is not None else value)
+            for fmt, value in zip(self._formatters, raw)
+        ]
+        if key is not None:
+            if len(self._rows) >= ROW_CACHE_LIMIT:
+                self._rows.clear()
+            self._rows[key] = (raw, values)
+        return values
@@ -0,0 +1,158 @@
+# search_index.py
+
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+# Точка отсчета для времени без часового пояса
+EPOCH = datetime(1970, 1, 1)
+
+
+def normalize_text(value):
+    """Текст для поиска: без None и в нижнем регистре."""
+    return '' if value is None else str(value).lower()
+
+
+def wall_clock_seconds(value):
+    """
+    Секунды от EPOCH для ISO-времени «как написано» (часовой пояс отбрасывается),
+    либо None, если значение не разбирается.
+    """
+    if isinstance(value, datetime):
+        dt = value
+    elif isinstance(value, str) and value:
+        try:
+            dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    else:
+        return None
+    return (dt.replace(tzinfo=None) - EPOCH).total_seconds()
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class RangeIndex:
+    """Отсортированные значения поля: выборка диапазона двоичным поиском."""
+    def __init__(self, pairs):
+        pairs = sorted(pairs, key=lambda pair: pair[0])
+        self.values = [value for value, _ in pairs]
+        self.keys = [key for _, key in pairs]
+
+    def between(self, low=None, high=None):
+        """Ключи записей со значением в [low, high] (границы включительно)."""
+        start = 0 if low is None else bisect_left(self.values, low)
+        end = len(self.values) if high is None else bisect_right(self.values, high)
+        return set(self.keys[start:end])
+
+
+class SearchIndex:
+    """
+    Заранее подготовленные строки поиска по записям одного набора данных.
+
+    Для каждой записи (по ключу id/temp_id) хранится общая строка поиска
+    в нижнем регистре и отдельные поля для точечных фильтров. Для запросов
+    от трех символов строится триграммный индекс: кандидаты — записи,
+    содержащие все триграммы запроса, и только они проверяются подстрокой.
+    Дополнительно можно индексировать поля на равенство (add_value/where)
+    и диапазон (add_point/between) — результаты разных фильтров
+    пересекаются как множества ключей.
+    Индекс действителен, пока не изменилась версия данных (version).
+    """
+    def __init__(self, version=None):
+        self.version = version
+        self.keys = []
+        self.haystacks = []
+        self.fields = {}
+        self._positions = {}
+        self._trigrams = None
+        self._last_query = None
+        self._last_result = None
+        self._equal = {}
+        self._points = {}
+        self._ranges = {}
+
+    def add(self, key, haystack, **fields):
+        """Добавляет запись; повторный ключ игнорируется (возвращается False)."""
+        if key in self._positions:
+            return False
+        self._positions[key] = len(self.keys)
+        self.keys.append(key)
+        self.haystacks.append(haystack)
+        self.fields[key] = fields
+        self._trigrams = None
+        self._last_query = None
+        return True
+
+    def position(self, key):
+        """Порядковый номер записи в индексе (в порядке добавления)."""
+        return self._positions[key]
+
+    def add_value(self, field, key, value):
+        self._equal.setdefault(field, {}).setdefault(value, set()).add(key)
+
+    def add_point(self, field, key, value):
+        if value is not None:
+            self._points.setdefault(field, []).append((value, key))
+            self._ranges.pop(field, None)
+
+    def where(self, field, value):
+        """Ключи записей, у которых поле равно value."""
+        return self._equal.get(field, {}).get(value, set())
+
+    def between(self, field, low=None, high=None):
+        """Ключи записей со значением поля в [low, high]; без значения не попадают."""
+        ranges = self._ranges.get(field)
+        if ranges is None:
+            ranges = self._ranges[field] = RangeIndex(self._points.get(field, []))
+        return ranges.between(low, high)
+
+    def __contains__(self, key):
+        return key in self._positions
+
+    def field(self, key, name):
+        return self.fields.get(key, {}).get(name, '')
+
+    def _build_trigrams(self):
+        # Строится при первом поиске от трех символов
+        index = {}
+        for pos, haystack in enumerate(self.haystacks):
+            for gram in trigrams(haystack):
+                postings = index.get(gram)
+                if postings is None:
+                    postings = index[gram] = array('I')
+                postings.append(pos)
+        self._trigrams = index
+
+    def _candidates(self, query):
+        if self._last_query and self._last_query in query:
+            # Уточнение предыдущего запроса — ищем только среди его результатов
+            return self._last_result
+        if len(query) < 3:
+            return range(len(self.keys))
+        if self._trigrams is None:
+            self._build_trigrams()
+        postings = []
+        for gram in trigrams(query):
+            found = self._trigrams.get(gram)
+            if not found:
+                return ()
+            postings.append(found)
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for other in postings[1:]:
+            if len(candidates) < 64:
+                break
+            candidates.intersection_update(other)
+        return sorted(candidates)
+
+    def search(self, query):
+        """Множество ключей записей, строка поиска которых содержит query."""
+        query = normalize_text(query)
+        if not query:
+            return set(self.keys)
+        result = [pos for pos in self._candidates(query) if query in self.haystacks[pos]]
+        self._last_query, self._last_result = query, result
+        return {self.keys[pos] for pos in result}
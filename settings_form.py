@@ -9,11 +9,17 @@ class SettingsForm(ctk.CTkFrame):
     """
     Форма для управления настройками по умолчанию для Путевого Листа.
     """
-    def __init__(self, master, api_client, on_save_callback=None):
+    # Как часто обновлять строку состояния автосинхронизации, мс
+    SYNC_STATUS_REFRESH_MS = 1000
+
+    def __init__(self, master, api_client, on_save_callback=None, sync_scheduler=None, on_force_sync=None):
         super().__init__(master, fg_color="transparent")
 
         self.api_client = api_client
         self.on_save_callback = on_save_callback
+        self.sync_scheduler = sync_scheduler
+        self.on_force_sync = on_force_sync
+        self._sync_status_job = None
         self.cache_key = 'default_pl_settings'
         self.fields = {}
 
@@ -44,9 +50,39 @@ class SettingsForm(ctk.CTkFrame):
         self.btn_save = ctk.CTkButton(self, text="Сохранить настройки", command=self.save_settings, width=220)
         self.btn_save.pack(pady=20)
 
+        # Состояние автосинхронизации: последний запуск, длительность, следующий запуск
+        if self.sync_scheduler:
+            sync_frame = ctk.CTkFrame(self, fg_color="transparent")
+            sync_frame.pack(fill="x", padx=10, pady=(0, 10))
+            self.sync_status_label = ctk.CTkLabel(sync_frame, text="", anchor="w", justify="left")
+            self.sync_status_label.pack(side="left", fill="x", expand=True)
+            ctk.CTkButton(
+                sync_frame, text="Синхронизировать сейчас",
+                command=self.sync_scheduler.run_now, width=200
+            ).pack(side="right")
+            self.refresh_sync_status()
+
+        # Справочники обновляются по TTL; здесь — загрузка заново всех сразу
+        if self.on_force_sync:
+            ctk.CTkButton(
+                self, text="Обновить справочники полностью",
+                command=self.on_force_sync, width=260
+            ).pack(padx=10, pady=(0, 10), anchor="w")
+
         # Загрузка сохраненных значений
         self.load_settings()
 
+    def refresh_sync_status(self):
+        self.sync_status_label.configure(text=self.sync_scheduler.status_text())
+        self._sync_status_job = self.after(self.SYNC_STATUS_REFRESH_MS, self.refresh_sync_status)
+
+    def destroy(self):
+        # Команда after удаляется вместе с виджетом — таймер нужно снять заранее
+        if self._sync_status_job is not None:
+            self.after_cancel(self._sync_status_job)
+            self._sync_status_job = None
+        super().destroy()
+
     # ---------- Persistence ----------
     def save_settings(self):
         """Сохраняет настройки в кэш"""
@@ -0,0 +1,70 @@
+# single_flight.py
+
+import threading
+import time
+
+
+class _Call:
+    def __init__(self, generation):
+        self.generation = generation
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Объединение одновременных одинаковых запросов.
+
+    run(key, func) выполняет func только в одном потоке на ключ: остальные
+    потоки с тем же ключом ждут и получают тот же результат. Результат,
+    полученный менее fresh_for секунд назад, отдается сразу без запроса.
+
+    invalidate(key) вызывается после изменения данных на сервере: прошлый
+    результат больше не используется, а к запросу, начатому до изменения,
+    новые вызовы не присоединяются — они дожидаются его и делают свой.
+    """
+    def __init__(self, fresh_for=3.0):
+        self.fresh_for = fresh_for
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._last = {}
+        self._generations = {}
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            self._last.pop(key, None)
+
+    def run(self, key, func):
+        while True:
+            with self._lock:
+                generation = self._generations.get(key, 0)
+                last = self._last.get(key)
+                if last is not None and time.monotonic() - last[0] < self.fresh_for:
+                    return last[1]
+                call = self._calls.get(key)
+                if call is None:
+                    call = self._calls[key] = _Call(generation)
+                    break
+            # Идущий запрос: общий результат, либо (если он начат до
+            # изменения данных) ждем его окончания и запускаем свой
+            call.event.wait()
+            if call.generation == generation:
+                if call.error is not None:
+                    raise call.error
+                return call.result
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                if call.error is None and self._generations.get(key, 0) == call.generation:
+                    self._last[key] = (time.monotonic(), call.result)
+            call.event.set()
+        return call.result
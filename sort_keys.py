@@ -0,0 +1,90 @@
+# sort_keys.py
+
+from datetime import datetime
+from data_cache import LocalCache
+from row_formatter import DATETIME_FIELDS, LOOKUP_FIELDS
+
+# Колонки, которые всегда сравниваются как числа
+NUMERIC_FIELDS = ('tonn', 'fuel_consumption', 'id')
+
+
+def text_key(value):
+    """Ключ для сравнения текста по-русски: без регистра, «ё» как «е»."""
+    return str(value).strip().casefold().replace('ё', 'е')
+
+
+def number_value(value):
+    """Число из значения вида '12,5' / '12.5' / 12.5, иначе None."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    try:
+        return float(str(value).replace(' ', '').replace(',', '.'))
+    except (TypeError, ValueError):
+        return None
+
+
+def natural_key(value):
+    """Числа раньше текста и сравниваются как числа, текст — через text_key."""
+    number = number_value(value)
+    if number is not None:
+        return (0, number, '')
+    return (1, 0.0, text_key(value))
+
+
+def datetime_key(value):
+    if not isinstance(value, str):
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+class SortKeys:
+    """
+    Типизированные ключи сортировки колонок таблицы.
+
+    Ключ записи вычисляется один раз и хранится вместе с исходным значением
+    поля: при следующей сортировке пересчитываются только изменившиеся
+    записи. Пустое значение дает ключ None — такие записи идут в конце.
+    Справочники фиксируются при создании, после их обновления нужен новый SortKeys.
+    """
+    def __init__(self, related_data):
+        self.related_data = related_data
+        self._cache = {}
+
+    def _compile(self, field):
+        if field in NUMERIC_FIELDS:
+            return number_value
+        if field in DATETIME_FIELDS:
+            return datetime_key
+        if field in LOOKUP_FIELDS:
+            endpoint, name_field = LOOKUP_FIELDS[field]
+            refs = self.related_data.get(endpoint, {})
+
+            def key(value):
+                ref = refs.get(value)
+                name = ref.get(name_field) if ref is not None else None
+                return text_key(name if name not in (None, '') else value)
+            return key
+        return natural_key
+
+    def key_func(self, field):
+        """Функция item → ключ сортировки (или None) для колонки field."""
+        convert = self._compile(field)
+        cache = self._cache.setdefault(field, {})
+        record_key = LocalCache.record_key
+
+        def key(item):
+            raw = item.get(field)
+            if raw is None or raw == '':
+                return None
+            rkey = record_key(item)
+            cached = cache.get(rkey) if rkey is not None else None
+            if cached is not None and cached[0] == raw:
+                return cached[1]
+            value = convert(raw)
+            if rkey is not None:
+                cache[rkey] = (raw, value)
+            return value
+        return key
@@ -0,0 +1,258 @@
+# sqlite_cache.py
+
+import json
+import sqlite3
+from data_cache import LocalCache
+
+# Поля записей, вынесенные в отдельные колонки с индексами
+INDEXED_COLUMNS = ('numberPL', 'marsh', 'season', 'driver', 'unloading_time', 'dispatch_info')
+COLUMNS_SQL = ", ".join(f'"{c}"' for c in INDEXED_COLUMNS)
+
+
+class SQLiteCache(LocalCache):
+    """
+    Хранилище кэша в локальной базе SQLite с тем же API, что и LocalCache.
+
+    Списки записей (реестр, справочники, очереди) хранятся построчно —
+    одна запись на строку с ключом (эндпоинт, id/temp_id), поэтому
+    upsert_records/delete_records меняют только затронутые строки.
+    Остальные значения (настройки, данные пользователя) хранятся целиком.
+
+    Список в памяти после save_data/upsert_records/delete_records не
+    сбрасывается, а обновляется теми же изменениями, поэтому get_version и
+    changes_since не перечитывают базу. Пишет в базу только этот процесс,
+    так что версия меняется лишь при записи через API.
+    """
+    def __init__(self, cache_dir="cache", db_name="cache.sqlite3", **kwargs):
+        super().__init__(cache_dir, **kwargs)
+        self.db_path = self.cache_dir / db_name
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+        self._migrate_json_files()
+
+    # ---------- схема и миграция ----------
+    def _create_schema(self):
+        with self._lock, self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, data TEXT NOT NULL)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS collections (endpoint TEXT PRIMARY KEY)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self.conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS records (
+                    endpoint TEXT NOT NULL,
+                    rkey TEXT NOT NULL,
+                    pos INTEGER NOT NULL,
+                    data TEXT NOT NULL,
+                    {COLUMNS_SQL},
+                    PRIMARY KEY (endpoint, rkey)
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_records_pos ON records (endpoint, pos)")
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_records_numberpl ON records (endpoint, "numberPL")')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_records_marsh_season ON records (endpoint, "marsh", "season")')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_records_driver ON records (endpoint, "driver")')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_records_unloading ON records (endpoint, "unloading_time")')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_records_dispatch ON records (endpoint, "dispatch_info")')
+
+    def _migrate_json_files(self):
+        """Однократно переносит существующие cache/*.json в базу."""
+        with self._lock:
+            done = self.conn.execute("SELECT value FROM meta WHERE key = 'json_migrated'").fetchone()
+            if done:
+                return
+            migrated = 0
+            for json_file in sorted(self.cache_dir.glob("*.json")):
+                try:
+                    with open(json_file, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"-> Пропущен файл кэша {json_file.name}: {e}")
+                    continue
+                self.save_data(json_file.stem, data)
+                migrated += 1
+            with self.conn:
+                self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', '1')")
+            if migrated:
+                print(f"-> Кэш перенесен в SQLite: {migrated} файлов")
+
+    # ---------- вспомогательное ----------
+    def _storage_key(self, key):
+        # Совпадает с именем JSON-файла, чтобы миграция и API давали одинаковые ключи
+        return key.replace('/', '_')
+
+    def _row_for(self, skey, pos, record):
+        rkey = self.record_key(record)
+        if rkey is None:
+            rkey = f"@{pos}"
+        values = [skey, rkey, pos, json.dumps(record, ensure_ascii=False)]
+        if isinstance(record, dict):
+            values.extend(self._column_value(c, record.get(c)) for c in INDEXED_COLUMNS)
+        else:
+            values.extend(None for _ in INDEXED_COLUMNS)
+        return values
+
+    def _column_value(self, field, value):
+        # В колонки индекса попадают только скалярные значения;
+        # вложенные объекты (например, driver как словарь) — NULL
+        if isinstance(value, (str, int, float)):
+            return self.normalize_field(field, value)
+        return None
+
+    def _insert_sql(self):
+        return (
+            f"INSERT INTO records (endpoint, rkey, pos, data, {COLUMNS_SQL}) "
+            f"VALUES ({', '.join('?' for _ in range(4 + len(INDEXED_COLUMNS)))}) "
+            f"ON CONFLICT (endpoint, rkey) DO UPDATE SET data = excluded.data, "
+            + ", ".join(f'"{c}" = excluded."{c}"' for c in INDEXED_COLUMNS)
+        )
+
+    def _changed(self, key):
+        self._drop_entry(key)
+        self._bump_version(key)
+
+    def _update_memory(self, key, apply):
+        # Новый список, а не изменение старого: прежний могут читать другие потоки
+        entry = self._memory.get(key)
+        if entry is None:
+            return
+        if not isinstance(entry[0], list):
+            self._drop_entry(key)
+            return
+        self._remember(key, apply(entry[0]), entry[1])
+
+    def _upserted(self, items, records):
+        items = list(items)
+        positions = {self.record_key(it): i for i, it in enumerate(items)}
+        for rec in records:
+            rkey = self.record_key(rec)
+            if rkey is not None and rkey in positions:
+                items[positions[rkey]] = rec
+            else:
+                positions[rkey] = len(items)
+                items.append(rec)
+        return items
+
+    # ---------- основное API ----------
+    def get_version(self, key):
+        """Номер версии данных ключа (без чтения базы)."""
+        with self._lock:
+            return self._versions.get(key, 0)
+
+    def load_data(self, key):
+        """Загружает данные из базы (с кэшем в памяти до следующей записи)."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            skey = self._storage_key(key)
+            row = self.conn.execute("SELECT data FROM kv WHERE key = ?", (skey,)).fetchone()
+            if row is not None:
+                data, weight = json.loads(row[0]), len(row[0])
+            elif self.conn.execute("SELECT 1 FROM collections WHERE endpoint = ?", (skey,)).fetchone():
+                rows = self.conn.execute(
+                    "SELECT data FROM records WHERE endpoint = ? ORDER BY pos", (skey,)
+                ).fetchall()
+                data = [json.loads(r[0]) for r in rows]
+                weight = sum(len(r[0]) for r in rows)
+            else:
+                return None
+            self._remember(key, data, (None, weight))
+            return data
+
+    def save_data(self, key, data):
+        """Сохраняет данные: списки — построчно, остальное — целиком."""
+        skey = self._storage_key(key)
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM kv WHERE key = ?", (skey,))
+            self.conn.execute("DELETE FROM records WHERE endpoint = ?", (skey,))
+            if isinstance(data, list):
+                self.conn.execute("INSERT OR IGNORE INTO collections (endpoint) VALUES (?)", (skey,))
+                rows = [self._row_for(skey, pos, rec) for pos, rec in enumerate(data)]
+                self.conn.executemany(self._insert_sql(), rows)
+                weight = sum(len(row[3]) for row in rows)
+                # Повторы ключа в базе слиты в одну строку — тогда список читается из базы
+                unique = len({row[1] for row in rows}) == len(rows)
+            else:
+                self.conn.execute("DELETE FROM collections WHERE endpoint = ?", (skey,))
+                text = json.dumps(data, ensure_ascii=False)
+                self.conn.execute("INSERT INTO kv (key, data) VALUES (?, ?)", (skey, text))
+                weight = len(text)
+                unique = True
+            self._changed(key)
+            if unique:
+                # Как и в LocalCache, load_data отдает сохраненный объект
+                self._remember(key, data, (None, weight))
+
+    def delete_data(self, key):
+        skey = self._storage_key(key)
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM kv WHERE key = ?", (skey,))
+            self.conn.execute("DELETE FROM records WHERE endpoint = ?", (skey,))
+            self.conn.execute("DELETE FROM collections WHERE endpoint = ?", (skey,))
+            self._changed(key)
+
+    def upsert_records(self, key, records):
+        records = [r for r in records if isinstance(r, dict)]
+        if not records:
+            return
+        skey = self._storage_key(key)
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM kv WHERE key = ?", (skey,))
+            self.conn.execute("INSERT OR IGNORE INTO collections (endpoint) VALUES (?)", (skey,))
+            max_pos = self.conn.execute("SELECT COALESCE(MAX(pos), -1) FROM records WHERE endpoint = ?", (skey,)).fetchone()[0]
+            rows = [self._row_for(skey, max_pos + 1 + i, rec) for i, rec in enumerate(records)]
+            self.conn.executemany(self._insert_sql(), rows)
+            self._bump_version(key)
+            self._update_memory(key, lambda items: self._upserted(items, records))
+            self._log_change(key, upserted=records)
+
+    def delete_records(self, key, record_ids):
+        ids = [str(r) for r in record_ids if r is not None]
+        if not ids:
+            return 0
+        skey = self._storage_key(key)
+        with self._lock, self.conn:
+            removed = 0
+            for rkey in ids:
+                cur = self.conn.execute("DELETE FROM records WHERE endpoint = ? AND rkey = ?", (skey, rkey))
+                removed += cur.rowcount
+            if removed:
+                self._bump_version(key)
+                removed_keys = set(ids)
+                self._update_memory(
+                    key, lambda items: [it for it in items if self.record_key(it) not in removed_keys]
+                )
+                self._log_change(key, deleted=ids)
+            return removed
+
+    def query_records(self, key, **criteria):
+        """Поиск по индексированным полям идет в SQL, по остальным — в Python."""
+        indexed = {f: v for f, v in criteria.items() if f in INDEXED_COLUMNS}
+        rest = {f: v for f, v in criteria.items() if f not in INDEXED_COLUMNS}
+        sql = "SELECT data FROM records WHERE endpoint = ?"
+        params = [self._storage_key(key)]
+        for field, value in indexed.items():
+            value = self.normalize_field(field, value)
+            if value is None:
+                sql += f' AND "{field}" IS NULL'
+            else:
+                sql += f' AND "{field}" = ?'
+                params.append(value)
+        sql += " ORDER BY pos"
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        result = [json.loads(r[0]) for r in rows]
+        if rest:
+            result = [
+                it for it in result
+                if all(self.normalize_field(f, it.get(f)) == self.normalize_field(f, v) for f, v in rest.items())
+            ]
+        return result
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,155 @@
+# sync_scheduler.py
+
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Интервалы автосинхронизации, секунды
+FAST_INTERVAL = 15      # реестр на экране и данные меняются
+BASE_INTERVAL = 30      # реестр на экране, изменений нет
+IDLE_INTERVAL = 120     # окно свернуто или открыта другая вкладка
+MAX_BACKOFF = 300       # предел паузы после ошибок подряд
+
+
+class SyncScheduler:
+    """
+    Планировщик фоновой синхронизации поверх tkinter.after.
+
+    job() выполняется в рабочем потоке и возвращает (ok, changed):
+    ok=None — запуск пропущен (например, нет авторизации), changed —
+    изменились ли данные. Следующий запуск планируется только после
+    окончания текущего, поэтому запуски не накладываются друг на друга.
+
+    Интервал: после ошибок — экспоненциальная пауза со случайным разбросом
+    (BASE_INTERVAL · 2^(n-1), не больше MAX_BACKOFF); если is_active()
+    (реестр на экране) — FAST_INTERVAL при изменениях и BASE_INTERVAL без
+    них; иначе IDLE_INTERVAL. is_active вызывается в потоке UI.
+    """
+    def __init__(self, widget, job, is_active=None,
+                 fast_interval=FAST_INTERVAL, base_interval=BASE_INTERVAL,
+                 idle_interval=IDLE_INTERVAL, max_backoff=MAX_BACKOFF):
+        self.widget = widget
+        self.job = job
+        self.is_active = is_active or (lambda: True)
+        self.fast_interval = fast_interval
+        self.base_interval = base_interval
+        self.idle_interval = idle_interval
+        self.max_backoff = max_backoff
+
+        self.running = False
+        self.failures = 0
+        self.last_started = None
+        self.last_duration = None
+        self.last_ok = None
+        self.last_changed = False
+        self.interval = None
+        self.next_run = None
+        self._timer = None
+        self._stopped = True
+
+    # ---------- управление ----------
+    def start(self, delay=None):
+        self._stopped = False
+        self._schedule(self.base_interval if delay is None else delay)
+
+    def stop(self):
+        self._stopped = True
+        self._cancel_timer()
+        self.next_run = None
+
+    def run_now(self):
+        """Запускает синхронизацию сейчас, если она уже не идет."""
+        if not self._stopped and not self.running:
+            self._schedule(0)
+
+    def poke(self):
+        """Пользователь вернулся к реестру — не ждать до конца долгого интервала."""
+        if self._stopped or self.running or self.next_run is None:
+            return
+        if self.next_run - datetime.now() > timedelta(seconds=self.fast_interval):
+            self._schedule(self.fast_interval)
+
+    # ---------- внутреннее ----------
+    def _cancel_timer(self):
+        if self._timer is not None:
+            try:
+                self.widget.after_cancel(self._timer)
+            except Exception:
+                pass
+            self._timer = None
+
+    def _schedule(self, delay):
+        self._cancel_timer()
+        self.interval = delay
+        self.next_run = datetime.now() + timedelta(seconds=delay)
+        self._timer = self.widget.after(int(delay * 1000), self._tick)
+
+    def _tick(self):
+        self._timer = None
+        if self._stopped or self.running:
+            return
+        self.running = True
+        self.next_run = None
+        self.last_started = datetime.now()
+        threading.Thread(target=self._worker, daemon=True).start()
+
+    def _worker(self):
+        started = time.monotonic()
+        try:
+            ok, changed = self.job()
+        except Exception as e:
+            print(f"-> Ошибка автосинхронизации: {e}")
+            ok, changed = False, False
+        duration = time.monotonic() - started
+        try:
+            self.widget.after(0, self._finished, ok, changed, duration)
+        except Exception:
+            # Окно уже закрыто
+            pass
+
+    def _finished(self, ok, changed, duration):
+        self.running = False
+        self.last_duration = duration
+        self.last_ok = ok
+        self.last_changed = bool(changed)
+        if ok is not None:
+            self.failures = 0 if ok else self.failures + 1
+        if self._stopped:
+            return
+        self._schedule(self._next_delay(ok, changed))
+
+    def _next_delay(self, ok, changed):
+        if ok is False:
+            cap = min(self.max_backoff, self.base_interval * 2 ** (self.failures - 1))
+            # Половина паузы фиксирована, половина случайна — клиенты не бьют в сервер разом
+            return cap / 2 + random.uniform(0, cap / 2)
+        try:
+            active = self.is_active()
+        except Exception:
+            active = False
+        if not active:
+            interval = self.idle_interval
+        elif changed:
+            interval = self.fast_interval
+        else:
+            interval = self.base_interval
+        return interval * random.uniform(0.9, 1.1)
+
+    # ---------- состояние для UI ----------
+    def status_text(self):
+        parts = []
+        if self.running:
+            parts.append("идет синхронизация...")
+        elif self.last_started is not None:
+            result = "успешно" if self.last_ok else ("ошибка" if self.last_ok is False else "пропущено")
+            duration = f", {self.last_duration:.1f} с" if self.last_duration is not None else ""
+            parts.append(f"последняя {self.last_started:%H:%M:%S} ({result}{duration})")
+        if self.next_run is not None:
+            left = max(0, int((self.next_run - datetime.now()).total_seconds()))
+            parts.append(f"следующая {self.next_run:%H:%M:%S} (через {left} с)")
+        elif self._stopped:
+            parts.append("остановлена")
+        if self.failures:
+            parts.append(f"ошибок подряд: {self.failures}")
+        return "Автосинхронизация: " + " · ".join(parts)
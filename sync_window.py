@@ -32,6 +32,24 @@ class SyncWindow(ctk.CTkToplevel):
         self.progress_bar.set(progress)
         self.update_idletasks() # Немедленно обновляем интерфейс
 
+    def update_counts(self, done, total, conflicts=0, errors=0):
+        """
+        Показывает счетчики отправки; можно вызывать из фонового потока.
+        done — обработано записей (отправлено, конфликты и ошибки вместе).
+        """
+        def apply():
+            if not self.winfo_exists():
+                return
+            sent = done - conflicts - errors
+            text = f"Обработано записей: {done} из {total}\nОтправлено: {sent}"
+            if conflicts:
+                text += f", конфликтов: {conflicts}"
+            if errors:
+                text += f", ошибок: {errors}"
+            self.label.configure(text=text)
+            self.progress_bar.set(done / total if total else 1)
+        self.after(0, apply)
+
     def finish(self):
         """Завершает процесс и закрывает окно."""
         self.label.configure(text="Синхронизация завершена!")
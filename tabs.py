@@ -1,33 +1,39 @@
 # tabs.py
 
 import customtkinter as ctk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, filedialog
 from tkcalendar import DateEntry
 from create_pl_form import CreatePLForm
 from form_window import DataFormWindow
 from settings_form import SettingsForm
 from registry_card import RegistryCardWindow
+from tree_rows import TreeRows
+from search_index import SearchIndex, normalize_text, wall_clock_seconds
+from row_formatter import RowFormatter
+from sort_keys import SortKeys
+from aggregates import RegistryAggregates, dispatch_state
+from registry_export import export_rows
 import threading
 from datetime import datetime
 
+# Сколько строк сверх видимых держать в Treeview в виртуальном режиме
+VIRTUAL_BUFFER_ROWS = 10
 
-def format_datetime(iso_str):
-    """Форматирует ISO datetime в 'ДД.ММ.ГГГГ ЧЧ:ММ'"""
-    if not iso_str:
-        return ""
-    try:
-        dt = datetime.fromisoformat(iso_str.replace("Z", "+00:00")) if "Z" in iso_str else datetime.fromisoformat(iso_str)
-        return dt.strftime("%d.%m.%Y %H:%M")
-    except:
-        return str(iso_str)
+# Пауза после ввода в поле фильтра до запуска фильтрации, мс
+FILTER_DEBOUNCE_MS = 250
+
+# Справочники, через которые таблицы показывают названия вместо id
+RELATED_ENDPOINTS = ['drivers', 'cars', 'podryads', 'gruzes', 'seasons', 'car-markas', 'car-models']
 
 
 class DataTable(ctk.CTkFrame):
-    def __init__(self, master, api_client, endpoint, columns, sync_callback=None, upload_callback=None, can_edit=True, column_widths=None):
+    def __init__(self, master, api_client, endpoint, columns, sync_callback=None, upload_callback=None, can_edit=True, column_widths=None, virtual=False, filter_delay=FILTER_DEBOUNCE_MS, title=None):
         super().__init__(master, fg_color="transparent")
 
         self.api_client = api_client
         self.endpoint = endpoint
+        # Название таблицы (имя листа при экспорте)
+        self.table_title = title or endpoint
         self.columns_config = columns
         self.column_widths = column_widths or {} 
         self.sync_callback = sync_callback
@@ -35,6 +41,31 @@ class DataTable(ctk.CTkFrame):
         self.can_edit = can_edit
         self.all_data = []
         self.related_data = {}
+        self.reference = None
+        self._user_info_version = None
+        # (индекс поиска, список, по которому он построен, все ли записи в индексе)
+        self._search = None
+        # Сортировка по колонке (None — порядок по умолчанию, новые сверху)
+        self.sort_column = None
+        # Отфильтрованные записи в порядке по умолчанию и в порядке вывода
+        self.filtered_items = []
+        self.view_items = []
+        # Номер «#» записи при сортировке: id(запись) → номер (None — вид в порядке по умолчанию)
+        self._row_numbers = None
+        self.records_by_iid = {}
+        self.pending_temp_ids = set()
+        self.conflict_temp_ids = set()
+        # Виртуальный режим: в Treeview только видимые строки начиная с view_offset
+        self.virtual = virtual
+        self.view_offset = 0
+        self.visible_rows = 30
+        self.selected_keys = set()
+        self._additive_select = False
+        # Фильтрация в фоне: каждый новый запуск отменяет предыдущий
+        self.filter_delay = filter_delay
+        self._filter_job = None
+        self._filter_generation = 0
+        self._filter_lock = threading.Lock()
         self.filters = {
             "query": "",
             "season": None,
@@ -76,6 +107,10 @@ class DataTable(ctk.CTkFrame):
             self.add_button = ctk.CTkButton(self.control_frame, text="Добавить", command=self.add_item)
             self.add_button.pack(side="left", padx=(6, 6))
 
+        # Выгрузка отфильтрованных строк в Excel/CSV
+        self.export_button = ctk.CTkButton(self.control_frame, text="Экспорт", command=self.export_view, width=90)
+        self.export_button.pack(side="left", padx=(0, 6))
+
         # Панель фильтров
         self.filters_frame = ctk.CTkFrame(self, fg_color="transparent")
         self.filters_frame.pack(fill="x", pady=(0, 6))
@@ -122,50 +157,51 @@ class DataTable(ctk.CTkFrame):
             self.marsh_entry.bind("<KeyRelease>", self.on_marsh_change)
 
             # Фильтр по грузу
-            gruz_names = ["— все —"] + [g.get('name', '') for g in self.api_client.get_local_data('gruzes') if isinstance(g, dict)]
+            gruz_names = ["— все —"] + [g.get('name', '') for g in self.reference.items('gruzes')]
             self.gruz_combo = ctk.CTkComboBox(self.filters_frame, values=gruz_names, state="readonly", command=self.on_gruz_change, width=140)
             self.gruz_combo.set("— все —")
             self.gruz_combo.pack(side="right", padx=(6, 0))
 
             # Фильтр по сезону
-            season_names = ["— все —"] + [s.get('name', '') for s in self.api_client.get_local_data('seasons') if isinstance(s, dict)]
+            season_names = ["— все —"] + [s.get('name', '') for s in self.reference.items('seasons')]
             self.season_combo = ctk.CTkComboBox(self.filters_frame, values=season_names, state="readonly", command=self.on_season_change, width=140)
             self.season_combo.set("— все —")
             self.season_combo.pack(side="right", padx=(6, 0))
 
-            # Фильтр «Декада» (период разгрузки с учетом времени)
-            # ctk.CTkLabel(self.filters_frame, text="Декада (разгрузка):").pack(side="right", padx=(6, 2))
-            
+            # Фильтр «Декада» (период разгрузки с учетом времени).
+            # Элементы пакуются справа налево: «Декада: от – до»
+            self.reset_filters_btn = ctk.CTkButton(self.filters_frame, text="Сбросить фильтры", command=self.reset_filters, width=130)
+            self.reset_filters_btn.pack(side="right", padx=(6, 0))
+
+            # До: дата + время
+            decade_to_frame = ctk.CTkFrame(self.filters_frame, fg_color="transparent")
+            decade_to_frame.pack(side="right", padx=(0, 2))
+            self.decade_to_date = DateEntry(decade_to_frame, date_pattern='dd.mm.yyyy', width=10)
+            self.decade_to_date.pack(side="left")
+            self.decade_to_hour = ctk.CTkComboBox(decade_to_frame, values=[f"{h:02d}" for h in range(24)], width=50, command=lambda _: self.on_decade_change())
+            self.decade_to_hour.set("23")
+            self.decade_to_hour.pack(side="left", padx=2)
+            self.decade_to_min = ctk.CTkComboBox(decade_to_frame, values=[f"{m:02d}" for m in range(0, 60, 5)], width=50, command=lambda _: self.on_decade_change())
+            self.decade_to_min.set("55")
+            self.decade_to_min.pack(side="left")
+            self.decade_to_date.bind("<<DateEntrySelected>>", self.on_decade_change)
+
+            ctk.CTkLabel(self.filters_frame, text="–").pack(side="right", padx=2)
+
             # От: дата + время
-            # decade_from_frame = ctk.CTkFrame(self.filters_frame, fg_color="transparent")
-            # decade_from_frame.pack(side="right", padx=(2, 0))
-            # self.decade_from_date = DateEntry(decade_from_frame, date_pattern='dd.mm.yyyy', width=10)
-            # self.decade_from_date.pack(side="left")
-            # self.decade_from_hour = ctk.CTkComboBox(decade_from_frame, values=[f"{h:02d}" for h in range(24)], width=50, command=lambda _: self.on_decade_change())
-            # self.decade_from_hour.set("00")
-            # self.decade_from_hour.pack(side="left", padx=2)
-            # self.decade_from_min = ctk.CTkComboBox(decade_from_frame, values=[f"{m:02d}" for m in range(0, 60, 5)], width=50, command=lambda _: self.on_decade_change())
-            # self.decade_from_min.set("00")
-            # self.decade_from_min.pack(side="left")
-            # self.decade_from_date.bind("<<DateEntrySelected>>", self.on_decade_change)
-
-            # ctk.CTkLabel(self.filters_frame, text="–").pack(side="right", padx=2)
-
-            # # До: дата + время
-            # decade_to_frame = ctk.CTkFrame(self.filters_frame, fg_color="transparent")
-            # decade_to_frame.pack(side="right", padx=(0, 2))
-            # self.decade_to_date = DateEntry(decade_to_frame, date_pattern='dd.mm.yyyy', width=10)
-            # self.decade_to_date.pack(side="left")
-            # self.decade_to_hour = ctk.CTkComboBox(decade_to_frame, values=[f"{h:02d}" for h in range(24)], width=50, command=lambda _: self.on_decade_change())
-            # self.decade_to_hour.set("23")
-            # self.decade_to_hour.pack(side="left", padx=2)
-            # self.decade_to_min = ctk.CTkComboBox(decade_to_frame, values=[f"{m:02d}" for m in range(0, 60, 5)], width=50, command=lambda _: self.on_decade_change())
-            # self.decade_to_min.set("55")
-            # self.decade_to_min.pack(side="left")
-            # self.decade_to_date.bind("<<DateEntrySelected>>", self.on_decade_change)
-
-            # self.reset_filters_btn = ctk.CTkButton(self.filters_frame, text="Сбросить фильтры", command=self.reset_filters, width=130)
-            # self.reset_filters_btn.pack(side="right", padx=(0, 6))
+            decade_from_frame = ctk.CTkFrame(self.filters_frame, fg_color="transparent")
+            decade_from_frame.pack(side="right", padx=(2, 0))
+            self.decade_from_date = DateEntry(decade_from_frame, date_pattern='dd.mm.yyyy', width=10)
+            self.decade_from_date.pack(side="left")
+            self.decade_from_hour = ctk.CTkComboBox(decade_from_frame, values=[f"{h:02d}" for h in range(24)], width=50, command=lambda _: self.on_decade_change())
+            self.decade_from_hour.set("00")
+            self.decade_from_hour.pack(side="left", padx=2)
+            self.decade_from_min = ctk.CTkComboBox(decade_from_frame, values=[f"{m:02d}" for m in range(0, 60, 5)], width=50, command=lambda _: self.on_decade_change())
+            self.decade_from_min.set("00")
+            self.decade_from_min.pack(side="left")
+            self.decade_from_date.bind("<<DateEntrySelected>>", self.on_decade_change)
+
+            ctk.CTkLabel(self.filters_frame, text="Декада (разгрузка):").pack(side="right", padx=(6, 2))
 
         # Таблица
         style = ttk.Style()
@@ -189,6 +225,9 @@ class DataTable(ctk.CTkFrame):
         # Отправленные — тёмно‑синий с белым текстом
         self.tree.tag_configure('dispatched', background='#1565c0', foreground='#ffffff')
 
+        # Обновление Treeview по разнице с уже выведенными строками
+        self.tree_rows = TreeRows(self.tree)
+
         self.sort_directions = {}
 
         self.tree.heading("#", text="#", command=lambda: self.sort_by_column("#", True))
@@ -200,8 +239,29 @@ class DataTable(ctk.CTkFrame):
             width = self.column_widths.get(api_field, 130)
             self.tree.column(api_field, width=width, anchor='w')
 
-        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscrollcommand=self.scrollbar.set)
+        if self.endpoint == 'registries':
+            # Итоги по отфильтрованным записям под таблицей
+            self.aggregates = RegistryAggregates()
+            self.footer_label = ctk.CTkLabel(self, text="", anchor="w")
+            self.footer_label.pack(side="bottom", fill="x", padx=6, pady=(4, 0))
+
+        if self.virtual:
+            # Полоса прокрутки отражает весь набор строк, а не содержимое Treeview
+            self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self._on_virtual_scrollbar)
+            self.tree.configure(yscrollcommand=self._on_tree_yscroll)
+            self.tree.bind("<Configure>", self._on_tree_configure)
+            self.tree.bind("<MouseWheel>", self._on_mouse_wheel)
+            self.tree.bind("<Button-4>", self._on_mouse_wheel)
+            self.tree.bind("<Button-5>", self._on_mouse_wheel)
+            self.tree.bind("<Up>", lambda e: self._on_arrow_key(-1))
+            self.tree.bind("<Down>", lambda e: self._on_arrow_key(1))
+            self.tree.bind("<Prior>", lambda e: self._scroll_rows(-self.visible_rows) or "break")
+            self.tree.bind("<Next>", lambda e: self._scroll_rows(self.visible_rows) or "break")
+            self.tree.bind("<ButtonPress-1>", self._on_tree_press, add="+")
+            self.tree.bind("<<TreeviewSelect>>", self._on_tree_select)
+        else:
+            self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.tree.yview)
+            self.tree.configure(yscrollcommand=self.scrollbar.set)
         self.scrollbar.pack(side="right", fill="y")
         self.tree.pack(side="left", fill="both", expand=True)
 
@@ -255,253 +315,478 @@ class DataTable(ctk.CTkFrame):
 
 
     def _load_related_data(self):
-        endpoints = ['drivers', 'cars', 'podryads', 'gruzes', 'seasons', 'car-markas', 'car-models']
-        for endpoint in endpoints:
-            self.related_data[endpoint] = {
-                item.get('id'): item
-                for item in self.api_client.get_local_data(endpoint)
-                if isinstance(item, dict) and item.get('id') is not None
-            }
-        self.season_name_to_id = {v.get('name', ''): k for k, v in self.related_data.get('seasons', {}).items()}
-        self.gruz_name_to_id = {v.get('name', ''): k for k, v in self.related_data.get('gruzes', {}).items()}
+        # Общий снимок справочников: тот же объект — справочники не изменились.
+        # RowFormatter зависит еще от данных пользователя (колонка «Создал»)
+        snapshot = self.api_client.get_reference_data()
+        user_version = self.api_client.cache.get_version('current_user_info')
+        if snapshot is not self.reference:
+            self.reference = snapshot
+            self.related_data = snapshot.by_id
+            self.season_name_to_id = snapshot.name_to_id.get('seasons', {})
+            self.gruz_name_to_id = snapshot.name_to_id.get('gruzes', {})
+            # Названия в строках поиска и в ячейках могли измениться
+            self._search = None
+            self.sort_keys = SortKeys(self.related_data)
+        elif user_version == self._user_info_version:
+            return
+        self._user_info_version = user_version
+        self.row_formatter = RowFormatter(
+            self.columns_config.keys(), self.related_data, self.api_client.get_current_user_info()
+        )
 
     def reload_table_data(self):
         self._load_related_data()
         self.display_local_data()
 
-    def _apply_filters(self, items):
-        q = (self.filters.get("query") or "").lower()
-        season_id = self.filters.get("season")
-        gruz_id = self.filters.get("gruz")
-        marsh_q = (self.filters.get("marsh") or "").lower()
-        dispatch_q = (self.filters.get("dispatch") or "").lower()
-
-        # Декада с учетом времени
-        decade_from_date = self.filters.get("decade_from_date")
-        decade_from_hour = self.filters.get("decade_from_hour", 0)
-        decade_from_min = self.filters.get("decade_from_min", 0)
-        decade_to_date = self.filters.get("decade_to_date")
-        decade_to_hour = self.filters.get("decade_to_hour", 23)
-        decade_to_min = self.filters.get("decade_to_min", 59)
+    def _data_version(self):
+        """Версия данных таблицы и справочников — пока она та же, индекс поиска актуален."""
+        cache = self.api_client.cache
+        version = tuple(cache.get_version(e) for e in [self.endpoint] + RELATED_ENDPOINTS)
+        if self.endpoint == 'registries':
+            version += (self.api_client.get_pending_journal('registries').version,)
+        return version
 
-        def match(item: dict):
+    def _search_entry(self, item):
+        """Строка общего поиска записи и поля отдельных фильтров (в нижнем регистре)."""
+        fields = {}
+        if self.endpoint == 'registries':
+            drivers = self.related_data.get('drivers', {})
+            parts = [
+                drivers.get(item.get('driver'), {}).get('full_name', ''),
+                drivers.get(item.get('driver2'), {}).get('full_name', ''),
+                self.related_data.get('cars', {}).get(item.get('number'), {}).get('number', ''),
+                self.related_data.get('podryads', {}).get(item.get('pod'), {}).get('org_name', ''),
+                item.get('numberPL', ''),
+            ]
+            fields['marsh'] = normalize_text(item.get('marsh'))
+            fields['dispatch'] = normalize_text(item.get('dispatch_info'))
+        elif self.endpoint == 'drivers':
+            parts = [item.get('full_name'), item.get('phone_1'), item.get('phone_2'), item.get('phone_3')]
+            for cid in item.get('cars') or []:
+                c = self.related_data.get('cars', {}).get(cid)
+                if c:
+                    parts.append(c.get('number', ''))
+        elif self.endpoint == 'podryads':
+            parts = [item.get('org_name'), item.get('full_name'), item.get('phone_1')]
+        else:
+            parts = []
+        return " ".join(normalize_text(p) for p in parts), fields
+
+    def _get_search_index(self, items):
+        """
+        Индекс поиска по items для текущей версии данных: (индекс, source),
+        source — items, если каждая запись есть в индексе под своим номером.
+        Индекс собирается в локальной переменной и подставляется целиком,
+        поэтому сборка не требует блокировок; одновременная сборка в двух
+        потоках лишь повторит работу.
+
+        Версия читается уже после того, как вызывающий взял items, и может
+        быть новее их, поэтому готовый индекс берется, только если он
+        построен по этому же списку.
+        """
+        version = self._data_version()
+        current = self._search
+        if current is not None and current[1] is items and current[0].version == version:
+            return current[0], (items if current[2] else None)
+        index = SearchIndex(version)
+        complete = True
+        for item in items:
+            key = self.api_client.cache.record_key(item)
+            if key is None:
+                complete = False
+                continue
+            haystack, fields = self._search_entry(item)
+            if not index.add(key, haystack, **fields):
+                complete = False
+                continue
             if self.endpoint == 'registries':
-                if season_id and item.get('season') != season_id:
-                    return False
-                if gruz_id and item.get('gruz') != gruz_id:
+                index.add_value('season', key, item.get('season'))
+                index.add_value('gruz', key, item.get('gruz'))
+                index.add_point('unloading_time', key, wall_clock_seconds(item.get('unloading_time')))
+        # Пока индекс строился, данные могли перезагрузиться — индекс по
+        # устаревшему списку не подставляется, его следующий вызов соберет заново
+        if items is self.all_data:
+            self._search = (index, items, complete)
+        return index, (items if complete else None)
+
+    @staticmethod
+    def _decade_bounds(filters):
+        """Границы периода разгрузки в секундах (как у wall_clock_seconds) или None."""
+        bounds = []
+        for prefix, default_hour, default_min in (("decade_from", 0, 0), ("decade_to", 23, 59)):
+            date_value = filters.get(f"{prefix}_date")
+            if not date_value:
+                bounds.append(None)
+                continue
+            dt = datetime.combine(date_value, datetime.min.time()).replace(
+                hour=filters.get(f"{prefix}_hour", default_hour),
+                minute=filters.get(f"{prefix}_min", default_min),
+            )
+            bounds.append(wall_clock_seconds(dt))
+        return tuple(bounds)
+
+    def _filters_active(self, filters):
+        """Задан ли хоть один фильтр (иначе фильтрация — просто копия списка)."""
+        if any(filters.get(name) for name in ("query", "season", "gruz", "marsh", "dispatch")):
+            return True
+        return self.endpoint == 'registries' and any(b is not None for b in self._decade_bounds(filters))
+
+    def _apply_filters(self, items, filters=None, cancelled=None):
+        """
+        Отбирает записи по фильтрам (по умолчанию — текущим). Если cancelled()
+        вернул True, фильтрация прерывается и возвращается None.
+        """
+        filters = filters if filters is not None else self.filters
+        q = (filters.get("query") or "").lower()
+        season_id = filters.get("season")
+        gruz_id = filters.get("gruz")
+        marsh_q = (filters.get("marsh") or "").lower()
+        dispatch_q = (filters.get("dispatch") or "").lower()
+        # Декада по unloading_time с учетом времени
+        low, high = self._decade_bounds(filters) if self.endpoint == 'registries' else (None, None)
+        by_decade = low is not None or high is not None
+
+        if not self._filters_active(filters):
+            return [it for it in items if isinstance(it, dict)]
+
+        # Строки поиска, сезон, груз и время разгрузки берутся из индекса;
+        # результаты фильтров пересекаются как множества ключей, от меньшего
+        index, indexed_source = self._get_search_index(items)
+        selections = []
+        if season_id:
+            selections.append(index.where('season', season_id))
+        if gruz_id:
+            selections.append(index.where('gruz', gruz_id))
+        if by_decade:
+            selections.append(index.between('unloading_time', low, high))
+        if q:
+            selections.append(index.search(q))
+        allowed = None
+        for keys in sorted(selections, key=len):
+            allowed = keys if allowed is None else allowed & keys
+
+        record_key = self.api_client.cache.record_key
+
+        def match_unindexed(item):
+            if season_id and item.get('season') != season_id:
+                return False
+            if gruz_id and item.get('gruz') != gruz_id:
+                return False
+            if by_decade:
+                unload = wall_clock_seconds(item.get('unloading_time'))
+                if unload is None or (low is not None and unload < low) or (high is not None and unload > high):
                     return False
-                if marsh_q:
-                    if marsh_q not in str(item.get('marsh', '')).lower():
-                        return False
-                if dispatch_q:
-                    if dispatch_q not in str(item.get('dispatch_info', '')).lower():
-                        return False
-
-                # Декада по unloading_time с учетом времени
-                if decade_from_date or decade_to_date:
-                    unload = item.get('unloading_time')
-                    if unload:
-                        try:
-                            # Парсим и сразу убираем timezone
-                            if isinstance(unload, str):
-                                # Убираем timezone из строки: 2025-11-07T22:00:00+09:00 -> 2025-11-07T22:00:00
-                                unload_clean = unload.split('+')[0].split('Z')[0]
-                                dt = datetime.fromisoformat(unload_clean)
-                            else:
-                                dt = None
-                        except Exception as e:
-                            print(f"Ошибка парсинга unloading_time: {unload}, error: {e}")
-                            dt = None
-                        
-                        if dt:
-                            if decade_from_date:
-                                from_dt = datetime.combine(decade_from_date, datetime.min.time()).replace(hour=decade_from_hour, minute=decade_from_min)
-                                if dt < from_dt:
-                                    return False
-                            if decade_to_date:
-                                to_dt = datetime.combine(decade_to_date, datetime.min.time()).replace(hour=decade_to_hour, minute=decade_to_min)
-                                if dt > to_dt:
-                                    return False
-                        else:
-                            return False
-                    else:
-                        return False
-
-                # Общий поиск
-                if q:
-                    d1_name = self.related_data.get('drivers', {}).get(item.get('driver'), {}).get('full_name', '')
-                    d2_name = self.related_data.get('drivers', {}).get(item.get('driver2'), {}).get('full_name', '')
-                    car_num = self.related_data.get('cars', {}).get(item.get('number'), {}).get('number', '')
-                    pod_name = self.related_data.get('podryads', {}).get(item.get('pod'), {}).get('org_name', '')
-                    number_pl = str(item.get('numberPL', ''))
-                    haystack = " ".join([d1_name, d2_name, car_num, pod_name, number_pl]).lower()
-                    if q not in haystack:
-                        return False
-
-            elif self.endpoint == 'drivers':
-                if q:
-                    fname = str(item.get('full_name', '')).lower()
-                    phone1 = str(item.get('phone_1', '')).lower()
-                    phone2 = str(item.get('phone_2', '')).lower()
-                    phone3 = str(item.get('phone_3', '')).lower()
-                    car_ids = item.get('cars') or []
-                    car_nums = []
-                    for cid in car_ids:
-                        c = self.related_data.get('cars', {}).get(cid)
-                        if c:
-                            car_nums.append(str(c.get('number', '')).lower())
-                    haystack = " ".join([fname, phone1, phone2, phone3] + car_nums)
-                    if q not in haystack:
-                        return False
-
-            elif self.endpoint == 'podryads':
-                if q:
-                    org_name = str(item.get('org_name', '')).lower()
-                    full_name = str(item.get('full_name', '')).lower()
-                    phone = str(item.get('phone_1', '')).lower()
-                    haystack = " ".join([org_name, full_name, phone])
-                    if q not in haystack:
-                        return False
+            haystack, fields = self._search_entry(item)
+            return (q in haystack), fields
 
+        def match(item: dict):
+            key = record_key(item)
+            if key in index:
+                if allowed is not None and key not in allowed:
+                    return False
+                fields = index.fields[key]
+            else:
+                matched = match_unindexed(item)
+                if not matched or not matched[0]:
+                    return False
+                fields = matched[1]
+            # Фильтры по маршруту/отправке — подстрока в подготовленных полях
+            if marsh_q and marsh_q not in fields.get('marsh', ''):
+                return False
+            if dispatch_q and dispatch_q not in fields.get('dispatch', ''):
+                return False
             return True
 
-        return [it for it in items if isinstance(it, dict) and match(it)]
+        if allowed is not None and items is indexed_source:
+            # Индекс построен по этому же списку — проверяем только отобранные записи
+            candidates = [items[pos] for pos in sorted(index.position(key) for key in allowed)]
+        else:
+            candidates = items
 
+        result = []
+        for pos, it in enumerate(candidates):
+            if cancelled is not None and pos % 512 == 0 and cancelled():
+                return None
+            if isinstance(it, dict) and match(it):
+                result.append(it)
+        return result
 
-    def display_local_data(self, data_source=None):
-        for item in self.tree.get_children():
-            self.tree.delete(item)
 
+    def display_local_data(self, data_source=None):
         if self.endpoint == 'registries':
-            server_items = self.api_client.get_local_data('registries') or []
-            pending_items = self.api_client.get_local_data('pending_registries') or []
-            conflict_items = self.api_client.get_local_data('conflict_registries') or []
-            merged = [s for s in server_items if isinstance(s, dict)]
-
-            for p in pending_items:
-                if isinstance(p, dict):
-                    if not any(isinstance(s, dict) and s.get('id') == p.get('id') for s in server_items):
-                        merged.append(p)
-            for c in conflict_items:
-                if isinstance(c, dict):
-                    if not any(isinstance(s, dict) and (s.get('id') == c.get('id') or s.get('temp_id') == c.get('temp_id')) for s in merged):
-                        merged.append(c)
-            #Сортируем по ID (по убыванию — новые сверху)
-            merged.sort(key=lambda x: x.get('id') or 0, reverse=True)
-
-            self.all_data = merged
+            view = self.api_client.get_registry_view()
+            self.all_data = view.items
+            self.records_by_iid = view.by_iid
+            self.pending_temp_ids = view.pending_temp_ids
+            self.conflict_temp_ids = view.conflict_temp_ids
             if hasattr(self, 'upload_button'):
-                pending_count = len([p for p in pending_items if isinstance(p, dict)])
-                conflict_count = len([c for c in conflict_items if isinstance(c, dict)])
+                queued = view.pending_count()
                 text = "Обновить данные"
-                if pending_count + conflict_count > 0:
-                    text += f" ({pending_count + conflict_count})"
+                if queued > 0:
+                    text += f" ({queued})"
                 self.upload_button.configure(text=text)
         else:
             raw = self.api_client.get_local_data(self.endpoint)
             self.all_data = [it for it in raw if isinstance(it, dict)]
+            self.records_by_iid = {}
+            for it in self.all_data:
+                item_id = it.get('id') or it.get('temp_id')
+                if item_id is not None:
+                    self.records_by_iid.setdefault(str(item_id), it)
 
+        # Результат фоновой фильтрации по старым данным уже не нужен
+        self._cancel_filtering()
         source = data_source if data_source is not None else self.all_data
-        data_to_display = self._apply_filters(source)
+        if self._filters_active(self.filters):
+            # Индекс и фильтры — в фоновом потоке; до результата виден прежний вид
+            self._start_filtering(source, keep_offset=True)
+        else:
+            self._show_view(self._apply_filters(source))
+
+    def _show_view(self, view_items):
+        self.filtered_items = view_items
+        self.view_items = self._sorted(view_items)
+        self._update_row_numbers()
+        if self.virtual and self.selected_keys:
+            # Скрытые фильтром записи не остаются выделенными
+            view_keys = {self._row_iid(it, i) for i, it in enumerate(self.view_items)}
+            self.selected_keys &= view_keys
+        self._render_view()
+        self._update_footer()
+
+    def _update_footer(self):
+        if not hasattr(self, 'footer_label'):
+            return
+        # Итоги зависят только от записей реестра и очереди, не от справочников
+        self.aggregates.update(self.api_client.get_registry_view())
+        record_key = self.api_client.cache.record_key
+        totals = self.aggregates.summary(record_key(it) for it in self.view_items)
+
+        def number(value):
+            # + 0.0 убирает «-0,00» от погрешности при вычитании
+            return f"{round(value, 2) + 0.0:,.2f}".replace(",", " ").replace(".", ",")
+        self.footer_label.configure(
+            text=f"Строк: {len(self.view_items)}   Тоннаж: {number(totals['tonn'])}   "
+                 f"Топливо: {number(totals['fuel'])}   Сдали документы: {totals['received']}   "
+                 f"Отправлено: {totals['dispatched']}"
+        )
 
-        pending_temp_ids = [p.get('temp_id') for p in (self.api_client.get_local_data('pending_registries') or []) if isinstance(p, dict)]
-        conflict_temp_ids = [c.get('temp_id') for c in (self.api_client.get_local_data('conflict_registries') or []) if isinstance(c, dict)]
+    # ----- Фоновая фильтрация -----
+    def _cancel_filtering(self):
+        if self._filter_job is not None:
+            self.after_cancel(self._filter_job)
+            self._filter_job = None
+        self._filter_generation += 1
+
+    def _schedule_filtering(self):
+        """Откладывает фильтрацию до паузы во вводе (filter_delay мс)."""
+        self._cancel_filtering()
+        self._filter_job = self.after(self.filter_delay, self._start_filtering)
+
+    def _start_filtering(self, source=None, keep_offset=False):
+        """
+        Фильтрует source (по умолчанию all_data) в фоновом потоке. Поток UI
+        не берет _filter_lock: им упорядочены только рабочие потоки.
+        """
+        self._filter_job = None
+        self._filter_generation += 1
+        generation = self._filter_generation
+        filters = dict(self.filters)
+        source = self.all_data if source is None else source
+
+        def cancelled():
+            return generation != self._filter_generation
 
-        #обратная нумерация
-        total_count = len(data_to_display)
+        def worker():
+            # Предыдущий запуск, увидев отмену, быстро освобождает блокировку
+            with self._filter_lock:
+                if cancelled():
+                    return
+                view_items = self._apply_filters(source, filters, cancelled)
+            if view_items is None:
+                return
+
+            def done():
+                if not cancelled() and self.winfo_exists():
+                    if not keep_offset:
+                        # Новый набор фильтров показывается с начала
+                        self.view_offset = 0
+                    self._show_view(view_items)
+            self.after(0, done)
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _render_view(self):
+        """Выводит в Treeview строки view_items (в виртуальном режиме — только видимые)."""
+        total_count = len(self.view_items)
+        if self.virtual:
+            self.view_offset = max(0, min(self.view_offset, total_count - self.visible_rows))
+            start = self.view_offset
+            end = min(total_count, start + self.visible_rows + VIRTUAL_BUFFER_ROWS)
+        else:
+            start, end = 0, total_count
+
+        rows = [self._build_row(self.view_items[idx], idx) for idx in range(start, end)]
+        self._show_rows(rows)
+        if self.virtual:
+            self._update_virtual_scrollbar()
+
+    def _show_rows(self, rows):
+        # Меняются только добавленные/удаленные/измененные/переставленные строки,
+        # поэтому прокрутка и выделение при автообновлении сохраняются
+        self.tree_rows.update(rows)
+        if self.virtual:
+            if self.tree.yview()[0] > 0:
+                self.tree.yview_moveto(0)
+            visible_selected = [iid for iid in self.tree_rows.order if iid in self.selected_keys]
+            if set(visible_selected) != set(self.tree.selection()):
+                self.tree.selection_set(visible_selected)
+
+    # ----- Виртуальная прокрутка -----
+    def _update_virtual_scrollbar(self):
+        total = len(self.view_items)
+        if total <= self.visible_rows:
+            self.scrollbar.set(0.0, 1.0)
+            return
+        first = self.view_offset / total
+        last = min(1.0, (self.view_offset + self.visible_rows) / total)
+        self.scrollbar.set(first, last)
+
+    def _scroll_to(self, offset):
+        max_offset = max(0, len(self.view_items) - self.visible_rows)
+        offset = max(0, min(int(offset), max_offset))
+        if offset != self.view_offset:
+            self.view_offset = offset
+            self._render_view()
+
+    def _scroll_rows(self, delta):
+        self._scroll_to(self.view_offset + delta)
+
+    def _on_virtual_scrollbar(self, action, *args):
+        if action == "moveto":
+            self._scroll_to(float(args[0]) * len(self.view_items))
+        elif action == "scroll":
+            step = int(args[0])
+            if len(args) > 1 and args[1] == "pages":
+                step *= self.visible_rows
+            self._scroll_rows(step)
+
+    def _on_tree_yscroll(self, first, last):
+        """Собственная прокрутка Treeview (клик по неполной строке и т.п.) переводится в сдвиг окна."""
+        first = float(first)
+        if first <= 0:
+            return
+        shift = round(first * len(self.tree.get_children()))
+        self.tree.yview_moveto(0)
+        if shift:
+            self._scroll_rows(shift)
+
+    def _on_mouse_wheel(self, event):
+        if getattr(event, "num", None) == 4:
+            delta = -3
+        elif getattr(event, "num", None) == 5:
+            delta = 3
+        else:
+            delta = -3 if event.delta > 0 else 3
+        self._scroll_rows(delta)
+        return "break"
+
+    def _on_tree_configure(self, event):
+        try:
+            row_height = int(ttk.Style().lookup(self.tree.cget("style"), "rowheight") or 20)
+        except (TypeError, ValueError):
+            row_height = 20
+        # Высота заголовка ~25 пикселей
+        visible = max(1, (event.height - 25) // row_height)
+        if visible != self.visible_rows:
+            self.visible_rows = visible
+            self._render_view()
+
+    def _on_arrow_key(self, direction):
+        """Стрелки на краю видимой области сдвигают окно строк."""
+        children = self.tree.get_children()
+        focus = self.tree.focus()
+        if not children or focus not in children:
+            return None
+        pos = children.index(focus)
+        at_top = direction < 0 and pos == 0
+        at_bottom = direction > 0 and pos >= min(len(children), self.visible_rows) - 1
+        if not (at_top or at_bottom):
+            return None
+        target = self.view_offset + pos + direction
+        if target < 0 or target >= len(self.view_items):
+            return "break"
+        self._scroll_rows(direction)
+        iid = self._row_iid(self.view_items[target], target)
+        if self.tree.exists(iid):
+            self.tree.focus(iid)
+            self.selected_keys = {iid}
+            self.tree.selection_set(iid)
+        return "break"
+
+    def _on_tree_press(self, event):
+        # Shift/Control — добавление к выделению, иначе выделение заменяется
+        self._additive_select = bool(event.state & 0x0005)
+
+    def _on_tree_select(self, event=None):
+        """Сохраняет выделение, в том числе для строк вне видимой области."""
+        visible = set(self.tree.get_children())
+        current = set(self.tree.selection())
+        if current == self.selected_keys & visible:
+            return
+        if self._additive_select:
+            self.selected_keys = (self.selected_keys - visible) | current
+        else:
+            self.selected_keys = current
+
+    def _selected_iids(self):
+        if self.virtual:
+            return list(self.selected_keys)
+        return list(self.tree.selection())
+
+    def _update_row_numbers(self):
+        """
+        Номера «#» — обратная позиция записи в порядке по умолчанию
+        (filtered_items), так что при сортировке номер остается у своей записи.
+        """
+        if self.view_items is self.filtered_items:
+            self._row_numbers = None
+            return
+        total = len(self.filtered_items)
+        self._row_numbers = {id(it): total - pos for pos, it in enumerate(self.filtered_items)}
+
+    def _row_number(self, item, position):
+        if self._row_numbers is None:
+            return len(self.view_items) - position
+        return self._row_numbers[id(item)]
+
+    def _build_row(self, item, position):
+        """Возвращает (iid, значения, теги) строки для записи на позиции position."""
+        reverse_idx = self._row_number(item, position)
+        tags = []
+        if self.endpoint == 'registries':
+            temp_id = item.get('temp_id')
+            if temp_id in self.conflict_temp_ids:
+                tags.append('conflict')
+            elif temp_id in self.pending_temp_ids:
+                tags.append('unsynced')
+
+            # Зеленый — «получил»/«получили», синий — любая другая непустая
+            # отправка, пустое dispatch_info — без цветового тега
+            state = dispatch_state(item.get('dispatch_info'))
+            if state:
+                tags.append(state)
+
+        row_key = self.api_client.cache.record_key(item)
+        row_values = [reverse_idx] + self.row_formatter.format(item, row_key)
+
+        return self._row_iid(item, position), row_values, tags
+
+    @staticmethod
+    def _row_iid(item, position):
+        item_id = item.get('id') or item.get('temp_id')
+        return str(item_id) if item_id is not None else str(position + 1)
 
-        for idx, item in enumerate(data_to_display, start=1):
-            if not isinstance(item, dict):
-                continue
-            
-            reverse_idx = total_count - idx + 1
-            tags = []
-            if self.endpoint == 'registries':
-                temp_id = item.get('temp_id')
-                if temp_id in conflict_temp_ids:
-                    tags.append('conflict')
-                elif temp_id in pending_temp_ids:
-                    tags.append('unsynced')
-
-                # Исправлено: подсветка только по реальному состоянию отправки/получения            
-                dispatch_raw = item.get('dispatch_info', '')
-                dispatch = str(dispatch_raw or '').strip().lower()
-                if dispatch:
-                    # Зеленый: если явно содержит «получил»/«получили»
-                    if 'получил' in dispatch:
-                        tags.append('received')
-                    else:
-                        # Синий: любая другая непустая отправка
-                        tags.append('dispatched')
-                # Пустое dispatch_info — без цветового тега
-
-            row_values = [reverse_idx]
-            for api_field in self.columns_config.keys():
-                value = item.get(api_field)
-                display_value = ""
-                if value is not None:
-                    # форматируем все datetime поля
-                    if api_field == 'created_by':
-                        # value — это user_id
-                        # Сначала проверяем текущего пользователя
-                        current_user_info = self.api_client.get_current_user_info()
-                        
-                        if current_user_info and current_user_info.get('id') == value:
-                            # Это текущий пользователь
-                            first_name = current_user_info.get('first_name', '').strip()
-                            last_name = current_user_info.get('last_name', '').strip()
-                            username = current_user_info.get('username', '').strip()
-                            
-                            full_name = ' '.join(filter(None, [first_name, last_name]))
-                            display_value = full_name or username or str(value)
-                        else:
-                            # Другой пользователь (не текущий)
-                            # Показываем "Другой пользователь" или ID
-                            display_value = f"User #{value}"
-                    elif api_field in ['dataPOPL', 'dataSDPL', 'loading_time', 'unloading_time', 'approved_at']:
-                        display_value = format_datetime(value)
-                    elif api_field in ['driver', 'driver2']:
-                        display_value = self.related_data.get('drivers', {}).get(value, {}).get('full_name', value)
-                    elif api_field == 'number':
-                        display_value = self.related_data.get('cars', {}).get(value, {}).get('number', value)
-                    elif api_field == 'pod' or api_field == 'contractor':
-                        display_value = self.related_data.get('podryads', {}).get(value, {}).get('org_name', value)
-                    elif api_field == 'gruz':
-                        display_value = self.related_data.get('gruzes', {}).get(value, {}).get('name', value)
-                    elif api_field == 'marka':
-                        display_value = self.related_data.get('car-markas', {}).get(value, {}).get('name', value)
-                    elif api_field == 'model':
-                        display_value = self.related_data.get('car-models', {}).get(value, {}).get('name', value)
-                    elif api_field == 'status':
-                        # Преобразуем английские статусы в русский текст
-                        status_map = {
-                            'draft': 'Черновик',
-                            'pending': 'На рассмотрении',
-                            'approved': 'Одобрено',
-                            'rejected': 'Отклонено',
-                            'active': 'Активен',
-                            'inactive': 'Неактивен',
-                        }
-                        display_value = status_map.get(str(value).lower(), value)
-                    elif api_field == 'cars':
-                        # Список ТС (для водителей)
-                        if isinstance(value, list):
-                            car_nums = []
-                            for cid in value:
-                                c = self.related_data.get('cars', {}).get(cid)
-                                if c:
-                                    car_nums.append(c.get('number', ''))
-                            display_value = ', '.join(car_nums)
-                        else:
-                            display_value = value
-                    else:
-                        display_value = value
-                row_values.append(display_value)
-
-            item_id = item.get('id') or item.get('temp_id')
-            iid_str = str(item_id) if item_id is not None else str(idx)
-            if not self.tree.exists(iid_str):
-                self.tree.insert("", "end", values=row_values, iid=iid_str, tags=tuple(tags))
 
     def mark_selected_received(self):
         if self.endpoint != 'registries':
@@ -520,24 +805,25 @@ class DataTable(ctk.CTkFrame):
         from datetime import datetime
         now = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
 
+        def on_progress(done_cnt, total, rec_id, ok):
+            def show():
+                if btn and btn.winfo_exists():
+                    btn.configure(text=f"Сдали документы ({done_cnt}/{total})")
+            self.after(0, show)
+
         def worker():
-            ok_cnt, err_cnt, skip_cnt = 0, 0, 0
-            for rec in sel:
-                rec_id = rec.get('id')
-                if not rec_id:
-                    skip_cnt += 1
-                    continue
-                payload = {"dispatch_info": "получили", "dataSDPL": now}
-                ok, resp, code = self.api_client.update_item('registries', rec_id, payload, use_patch=True)
-                if ok:
-                    ok_cnt += 1
-                else:
-                    err_cnt += 1
+            payload = {"dispatch_info": "получили", "dataSDPL": now}
+            updates = [(rec.get('id'), payload) for rec in sel if rec.get('id')]
+            skip_cnt = len(sel) - len(updates)
+            ok_ids, errors = self.api_client.bulk_update(
+                'registries', updates, progress_callback=on_progress, notify=False
+            )
+            ok_cnt, err_cnt = len(ok_ids), len(errors)
 
             def done():
                 # Вернуть кнопку
                 if btn and btn.winfo_exists():
-                    btn.configure(state="normal")
+                    btn.configure(state="normal", text="Сдали документы (выдел.)")
                 # Обновить таблицу и показать результат
                 if self.winfo_exists():
                     self.reload_table_data()
@@ -549,20 +835,126 @@ class DataTable(ctk.CTkFrame):
         threading.Thread(target=worker, daemon=True).start()    
 
     def sort_by_column(self, col, is_numeric=False):
-        pass
+        """Сортирует по колонке; повторный клик меняет направление."""
+        if col == self.sort_column:
+            self.sort_directions[col] = not self.sort_directions.get(col, False)
+        else:
+            self.sort_column = col
+            self.sort_directions[col] = False
+        self._update_sort_headings()
+        self.view_offset = 0
+        # От порядка по умолчанию, а не от прошлой сортировки — равные значения
+        # и колонка «#» не зависят от ранее выбранной колонки
+        self.view_items = self._sorted(self.filtered_items)
+        self._update_row_numbers()
+        self._render_view()
+
+    def _update_sort_headings(self):
+        for api_field, header_text in [("#", "#")] + list(self.columns_config.items()):
+            if api_field == self.sort_column:
+                header_text += " ▼" if self.sort_directions.get(api_field) else " ▲"
+            self.tree.heading(api_field, text=header_text)
+
+    def _sorted(self, items):
+        """
+        Упорядочивает записи (в порядке по умолчанию) по выбранной колонке.
+        Сортировка устойчивая: при равных значениях остается порядок по
+        умолчанию; пустые — в конце.
+        """
+        col = self.sort_column
+        if col is None:
+            return items
+        descending = self.sort_directions.get(col, False)
+        if col == "#":
+            # Номер строки — обратный порядку по умолчанию
+            return list(items) if descending else list(reversed(items))
+        key = self.sort_keys.key_func(col)
+        present, missing = [], []
+        for it in items:
+            k = key(it)
+            if k is None:
+                missing.append(it)
+            else:
+                present.append((k, it))
+        present.sort(key=lambda pair: pair[0], reverse=descending)
+        return [it for _, it in present] + missing
+
+    def prepare_search_index(self):
+        """
+        Строит индекс поиска заранее (из фонового потока). Блокировка
+        фильтрации не берется — перезагрузки и фильтры не ждут сборки;
+        если all_data за время сборки сменился, индекс отбрасывается.
+        """
+        self._get_search_index(self.all_data)
+
+    # ----- Экспорт -----
+    def export_view(self):
+        """Выгружает текущий вид (фильтры и сортировка) в XLSX или CSV в фоне."""
+        if not self.view_items:
+            messagebox.showinfo("Информация", "Нет строк для выгрузки.")
+            return
+        path = filedialog.asksaveasfilename(
+            title="Экспорт таблицы",
+            defaultextension=".xlsx",
+            initialfile=f"{self.endpoint}_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
+            filetypes=[("Книга Excel", "*.xlsx"), ("CSV (разделитель ;)", "*.csv")],
+        )
+        if not path:
+            return
+
+        items = list(self.view_items)
+        numbers = [self._row_number(item, position) for position, item in enumerate(items)]
+        total = len(items)
+        headers = ["#"] + list(self.columns_config.values())
+        # Без ключа RowFormatter не трогает свой кэш — безопасно из другого потока
+        formatter = self.row_formatter
+        self.export_button.configure(state="disabled")
+
+        def rows():
+            for number, item in zip(numbers, items):
+                yield [number] + formatter.format(item)
+
+        def on_progress(done_cnt, total_cnt):
+            def show():
+                if self.export_button.winfo_exists():
+                    self.export_button.configure(text=f"Экспорт ({done_cnt * 100 // max(total_cnt, 1)}%)")
+            self.after(0, show)
+
+        def worker():
+            try:
+                written = export_rows(
+                    path, headers, rows(), total=total, progress_callback=on_progress, title=self.table_title
+                )
+                error = None
+            except Exception as e:
+                written, error = 0, e
+
+            def done():
+                if self.export_button.winfo_exists():
+                    self.export_button.configure(state="normal", text="Экспорт")
+                if error:
+                    messagebox.showerror("Ошибка", f"Не удалось выгрузить таблицу:\n{error}")
+                else:
+                    messagebox.showinfo("Готово", f"Выгружено строк: {written}\n{path}")
+            self.after(0, done)
+
+        threading.Thread(target=worker, daemon=True).start()
 
     # ----- Поиск/фильтры -----
+    def _on_filters_changed(self):
+        self._schedule_filtering()
+
     def on_query_change(self, event):
         self.filters['query'] = self.search_entry.get().strip()
-        self.display_local_data()
+        self._on_filters_changed()
 
     def on_marsh_change(self, event):
         self.filters['marsh'] = self.marsh_entry.get().strip()
-        self.display_local_data()
+        self._on_filters_changed()
 
     def on_dispatch_change(self, event):
         self.filters['dispatch'] = self.dispatch_entry.get().strip()
-        self.display_local_data()
+        self._on_filters_changed()
 
     def on_decade_change(self, event=None):
         try:
@@ -581,21 +973,21 @@ class DataTable(ctk.CTkFrame):
             self.filters['decade_to_date'] = None
             self.filters['decade_to_hour'] = 23
             self.filters['decade_to_min'] = 59
-        self.display_local_data()
+        self._on_filters_changed()
 
     def on_season_change(self, selected: str):
         if selected and selected != "— все —":
             self.filters['season'] = self.season_name_to_id.get(selected)
         else:
             self.filters['season'] = None
-        self.display_local_data()
+        self._on_filters_changed()
 
     def on_gruz_change(self, selected: str):
         if selected and selected != "— все —":
             self.filters['gruz'] = self.gruz_name_to_id.get(selected)
         else:
             self.filters['gruz'] = None
-        self.display_local_data()
+        self._on_filters_changed()
 
     def reset_filters(self):
         self.filters = {
@@ -620,7 +1012,7 @@ class DataTable(ctk.CTkFrame):
             self.decade_to_date.set_date(datetime.now())
             self.decade_to_hour.set("23")
             self.decade_to_min.set("55")
-        self.display_local_data()
+        self._on_filters_changed()
 
     def filter_data(self, event):
         self.on_query_change(event)
@@ -639,30 +1031,18 @@ class DataTable(ctk.CTkFrame):
             if not sel:
                 return
             iid = sel[0]
-        rec = None
-        for it in self.all_data:
-            if not isinstance(it, dict):
-                continue
-            item_id = it.get('id') or it.get('temp_id')
-            if str(item_id) == str(iid):
-                rec = it
-                break
+        rec = self.records_by_iid.get(str(iid))
         if not rec:
             return
         RegistryCardWindow(self, self.api_client, rec, on_saved_callback=self.reload_table_data)
 
     # ----- Массовые действия -----
     def _get_selected_records(self):
-        iids = self.tree.selection()
         selected = []
-        for iid in iids:
-            for it in self.all_data:
-                if not isinstance(it, dict):
-                    continue
-                item_id = it.get('id') or it.get('temp_id')
-                if str(item_id) == str(iid):
-                    selected.append(it)
-                    break
+        for iid in self._selected_iids():
+            rec = self.records_by_iid.get(str(iid))
+            if rec is not None:
+                selected.append(rec)
         return selected
 
     def open_dispatch_dialog(self):
@@ -701,16 +1081,15 @@ class DataTable(ctk.CTkFrame):
             btn_ok.configure(state="disabled")
             text = entry.get().strip()
 
+            def on_progress(done_cnt, total, rec_id, ok):
+                self.after(0, lambda: set_status(f"Обработано: {done_cnt} из {total}"))
+
             def worker():
-                ok_cnt = 0
-                err_cnt = 0
-                for rec in sel:
-                    rec_id = rec.get('id')
-                    if not rec_id:
-                        continue
-                    ok, resp, code = self.api_client.update_item('registries', rec_id, {"dispatch_info": text}, use_patch=True)
-                    if ok: ok_cnt += 1
-                    else: err_cnt += 1
+                updates = [(rec.get('id'), {"dispatch_info": text}) for rec in sel if rec.get('id')]
+                ok_ids, errors = self.api_client.bulk_update(
+                    'registries', updates, progress_callback=on_progress, notify=False
+                )
+                ok_cnt, err_cnt = len(ok_ids), len(errors)
 
                 def done():
                     # Обновляем таблицу
@@ -729,31 +1108,65 @@ class DataTable(ctk.CTkFrame):
 
 
 class MainApplicationFrame(ctk.CTkFrame):
-    def __init__(self, master, api_client, on_logout_callback, sync_callback):
+    def __init__(self, master, api_client, on_logout_callback, sync_callback, sync_scheduler=None):
         super().__init__(master, fg_color="transparent")
 
         self.api_client = api_client
         self.on_logout = on_logout_callback
         self.sync_callback = sync_callback
+        self.sync_scheduler = sync_scheduler
+
+        # Состояние данных: от какого времени кэш, идет ли фоновое обновление
+        self.status_label = ctk.CTkLabel(self, text="", anchor="e", text_color="gray")
+        self.status_label.pack(side="bottom", fill="x", padx=10)
 
-        self.tab_view = ctk.CTkTabview(self, anchor="w")
+        self.tab_view = ctk.CTkTabview(self, anchor="w", command=self._on_tab_changed)
         self.tab_view.pack(fill="both", expand=True)
 
-        self.tab_view.add("Реестр")
-        self.tab_view.add("Создать ПЛ")
-        self.tab_view.add("Водители")
-        self.tab_view.add("Подрядчики")
-        self.tab_view.add("Настройки")
+        # Вкладки строятся при первом открытии; сразу — только реестр
+        self._tab_builders = {
+            "Реестр": self.create_registry_tab,
+            "Создать ПЛ": self.create_pl_creation_tab,
+            "Водители": self.create_drivers_tab,
+            "Подрядчики": self.create_contractors_tab,
+            "Настройки": self.create_settings_tab,
+        }
+        self._built_tabs = set()
+        for tab_name in self._tab_builders:
+            self.tab_view.add(tab_name)
+        self.tab_view.set("Реестр")
+        self._ensure_tab("Реестр")
 
-        self.create_registry_tab(self.tab_view.tab("Реестр"))
-        self.create_pl_creation_tab(self.tab_view.tab("Создать ПЛ"))
-        self.create_drivers_tab(self.tab_view.tab("Водители"))
-        self.create_contractors_tab(self.tab_view.tab("Подрядчики"))
-        self.create_settings_tab(self.tab_view.tab("Настройки"))
+        # Индексы, нужные позже (поиск по реестру, справочники), готовятся в фоне
+        threading.Thread(target=self._warm_up, daemon=True).start()
 
         # self.logout_button = ctk.CTkButton(self.tab_view.tab("Настройки"), text="Выйти", command=self.handle_logout, width=200)
         # self.logout_button.pack(side='bottom', pady=50)
 
+    def set_sync_status(self, text):
+        if self.status_label.winfo_exists():
+            self.status_label.configure(text=text)
+
+    def _ensure_tab(self, tab_name):
+        """Строит содержимое вкладки, если оно еще не создано."""
+        if tab_name in self._built_tabs:
+            return
+        self._built_tabs.add(tab_name)
+        self._tab_builders[tab_name](self.tab_view.tab(tab_name))
+
+    def _on_tab_changed(self):
+        tab_name = self.tab_view.get()
+        self._ensure_tab(tab_name)
+        if tab_name == "Реестр" and self.sync_scheduler:
+            self.sync_scheduler.poke()
+
+    def _warm_up(self):
+        try:
+            self.api_client.get_reference_data()
+            self.registry_table.prepare_search_index()
+        except Exception as e:
+            print(f"-> Ошибка фоновой подготовки данных: {e}")
+
     def create_registry_tab(self, tab):
         columns = {
             "created_by": "Создал", 
@@ -804,7 +1217,9 @@ class MainApplicationFrame(ctk.CTkFrame):
             columns,
             column_widths=column_widths,  # НОВОЕ: передаем ширины
             sync_callback=self.sync_callback,
-            upload_callback=self.upload_pending
+            upload_callback=self.upload_pending,
+            virtual=True,
+            title="Реестр"
         )
         self.registry_table.pack(fill="both", expand=True)
 
@@ -835,6 +1250,9 @@ class MainApplicationFrame(ctk.CTkFrame):
         self.pl_form.pack(fill="both", expand=True)
 
     def reload_pl_creation_tab(self):
+        if "Создать ПЛ" not in self._built_tabs:
+            # Еще не открывалась — при открытии загрузит свежие данные
+            return
         if hasattr(self, 'pl_form') and self.pl_form.winfo_exists():
             self.pl_form.reload_settings()
         else:
@@ -856,7 +1274,7 @@ class MainApplicationFrame(ctk.CTkFrame):
             'phone_1': 'Телефон',
             'status': 'Статус'
         }
-        DataTable(tab, self.api_client, 'drivers', columns, can_edit=False).pack(fill="both", expand=True)
+        DataTable(tab, self.api_client, 'drivers', columns, can_edit=False, title="Водители").pack(fill="both", expand=True)
 
     def create_contractors_tab(self, tab):
         # Столбцы: название, руководитель, телефон, статус (русский текст)
@@ -866,10 +1284,15 @@ class MainApplicationFrame(ctk.CTkFrame):
             'phone_1': 'Телефон',
             'status': 'Статус'
         }
-        DataTable(tab, self.api_client, 'podryads', columns, can_edit=False).pack(fill="both", expand=True)
+        DataTable(tab, self.api_client, 'podryads', columns, can_edit=False, title="Подрядчики").pack(fill="both", expand=True)
 
     def create_settings_tab(self, tab):
-        self.settings_frame = SettingsForm(tab, self.api_client, on_save_callback=self.reload_pl_creation_tab)
+        self.settings_frame = SettingsForm(
+            tab, self.api_client,
+            on_save_callback=self.reload_pl_creation_tab,
+            sync_scheduler=self.sync_scheduler,
+            on_force_sync=lambda: self.sync_callback(force=True)
+        )
         self.settings_frame.pack(fill="both", expand=True, padx=20, pady=20)
 
         #Информация о пользователе над кнопкой "Выйти"
@@ -905,10 +1328,12 @@ class MainApplicationFrame(ctk.CTkFrame):
 
     def reload_all_tables(self):
         self.reload_pl_creation_tab()
-        if hasattr(self, 'settings_frame') and self.settings_frame.winfo_exists():
-            self.settings_frame.destroy()
-        self.create_settings_tab(self.tab_view.tab("Настройки"))
-        for tab_name in self.tab_view._name_list:
+        if "Настройки" in self._built_tabs:
+            settings_tab = self.tab_view.tab("Настройки")
+            for widget in settings_tab.winfo_children():
+                widget.destroy()
+            self.create_settings_tab(settings_tab)
+        for tab_name in self._built_tabs:
             tab_frame = self.tab_view.tab(tab_name)
             if tab_frame.winfo_children() and isinstance(tab_frame.winfo_children()[0], DataTable):
                 tab_frame.winfo_children()[0].reload_table_data()
@@ -0,0 +1,114 @@
+# tests/stub_server.py
+# Локальный сервер-заглушка API для тестов синхронизации
+
+import json
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+START_TIME = datetime(2025, 1, 1, 12, 0, 0)
+
+
+class StubState:
+    """
+    Данные сервера: записи эндпоинта с временем изменения, удаленные id
+    и журнал запросов. Время сервера — логические часы (секунда на изменение).
+
+    delta_supported=False — сервер не знает updated_since и всегда отдает
+    полный список, как старый бэкенд.
+    """
+    def __init__(self, records=(), delta_supported=True):
+        self.lock = threading.Lock()
+        self.clock = 0
+        self.delta_supported = delta_supported
+        self.records = {}
+        self.deleted = {}
+        self.requests = []
+        for record in records:
+            self.put(record)
+
+    def now(self):
+        return START_TIME + timedelta(seconds=self.clock)
+
+    def put(self, record):
+        with self.lock:
+            self.clock += 1
+            self.records[record['id']] = (dict(record), self.now())
+            self.deleted.pop(record['id'], None)
+
+    def delete(self, record_id):
+        with self.lock:
+            self.clock += 1
+            self.records.pop(record_id, None)
+            self.deleted[record_id] = self.now()
+
+    def etag(self):
+        return f'"v{self.clock}"'
+
+    def full_list(self):
+        return [record for record, _ in sorted(self.records.values(), key=lambda r: r[0]['id'])]
+
+    def changes_since(self, since):
+        changed = [r for r, updated in self.records.values() if updated > since]
+        deleted = [record_id for record_id, at in self.deleted.items() if at > since]
+        return sorted(changed, key=lambda r: r['id']), sorted(deleted)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=None, headers=None):
+        payload = b"" if body is None else json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if body is not None:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        state = self.server.state
+        url = urlsplit(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        with state.lock:
+            state.requests.append({
+                'path': url.path,
+                'params': params,
+                'if_none_match': self.headers.get('If-None-Match'),
+            })
+            etag = state.etag()
+            server_time = state.now().isoformat()
+            if self.headers.get('If-None-Match') == etag:
+                return self._send(304, headers={'ETag': etag})
+            headers = {'ETag': etag, 'X-Server-Time': server_time}
+            since = params.get('updated_since')
+            if since and state.delta_supported:
+                changed, deleted = state.changes_since(datetime.fromisoformat(since))
+                body = {'results': changed, 'deleted': deleted, 'server_time': server_time}
+                return self._send(200, body, headers)
+            return self._send(200, state.full_list(), headers)
+
+
+class StubServer:
+    """Сервер в фоновом потоке на свободном порту: with StubServer(state) as base_url: ..."""
+    def __init__(self, state):
+        self.state = state
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.httpd.state = state
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/api/v1/"
+
+    def __enter__(self):
+        self.thread.start()
+        return self.base_url
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
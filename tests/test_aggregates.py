@@ -0,0 +1,89 @@
+# tests/test_aggregates.py
+# Итоги под реестром: точечное обновление по изменениям вида реестра
+
+import tempfile
+import unittest
+
+from aggregates import RegistryAggregates
+from data_cache import LocalCache
+from registry_view import RegistryViewModel
+
+
+class FakeJournal:
+    def __init__(self):
+        self.version = 0
+        self.pending = []
+
+    def pending_items(self):
+        return list(self.pending)
+
+    def conflict_items(self):
+        return []
+
+
+class FakeClient:
+    def __init__(self, cache_dir):
+        self.cache = LocalCache(cache_dir)
+        self.journal = FakeJournal()
+
+    def get_pending_journal(self, endpoint):
+        return self.journal
+
+
+class RegistryAggregatesTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.client = FakeClient(tmp.name)
+        self.addCleanup(self.client.cache.flush, 10)
+        self.view = RegistryViewModel(self.client)
+        self.aggregates = RegistryAggregates()
+        self.rebuilds = 0
+        rebuild = self.aggregates.rebuild
+
+        def counted(*args):
+            self.rebuilds += 1
+            return rebuild(*args)
+        self.aggregates.rebuild = counted
+
+    def totals(self):
+        self.view.refresh()
+        self.aggregates.update(self.view)
+        return self.aggregates.summary(LocalCache.record_key(it) for it in self.view.items)
+
+    def test_changes_applied_without_rebuild(self):
+        cache = self.client.cache
+        cache.save_data('registries', [
+            {'id': 1, 'tonn': '10,5', 'dispatch_info': 'получил'},
+            {'id': 2, 'tonn': '4', 'fuel_consumption': 2},
+        ])
+        totals = self.totals()
+        self.assertEqual((totals['tonn'], totals['fuel'], totals['received']), (14.5, 2.0, 1))
+        self.assertEqual(self.rebuilds, 1)
+
+        cache.upsert_records('registries', [{'id': 2, 'tonn': '6', 'dispatch_info': 'отправлено'}])
+        cache.upsert_records('registries', [{'id': 3, 'tonn': 1}])
+        cache.delete_records('registries', ['1'])
+        self.client.journal.pending.append({'temp_id': 't1', 'tonn': '0,5'})
+        self.client.journal.version += 1
+        totals = self.totals()
+        self.assertEqual(totals, {'tonn': 7.5, 'fuel': 0.0, 'received': 0, 'dispatched': 1})
+
+        # Запись из очереди отправлена и пришла с сервера с id
+        self.client.journal.pending.clear()
+        self.client.journal.version += 1
+        cache.upsert_records('registries', [{'id': 4, 'temp_id': 't1', 'tonn': '0,5'}])
+        self.assertEqual(self.totals()['tonn'], 7.5)
+        self.assertEqual(self.rebuilds, 1)
+
+    def test_full_save_rebuilds(self):
+        cache = self.client.cache
+        cache.save_data('registries', [{'id': 1, 'tonn': 1}])
+        self.totals()
+        cache.save_data('registries', [{'id': 5, 'tonn': 2}])
+        self.assertEqual(self.totals()['tonn'], 2.0)
+        self.assertEqual(self.rebuilds, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
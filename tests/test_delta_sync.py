@@ -0,0 +1,98 @@
+# tests/test_delta_sync.py
+# Инкрементальная синхронизация реестра против локального сервера-заглушки
+
+import os
+import tempfile
+import unittest
+
+from api_client import APIClient
+from tests.stub_server import StubServer, StubState
+
+
+class DeltaSyncTest(unittest.TestCase):
+    def setUp(self):
+        # Кэш клиента пишется в ./cache — работаем во временной папке
+        self._cwd = os.getcwd()
+        self._tmp = tempfile.TemporaryDirectory()
+        os.chdir(self._tmp.name)
+        self.addCleanup(self._restore_cwd)
+
+    def _restore_cwd(self):
+        os.chdir(self._cwd)
+        self._tmp.cleanup()
+
+    def make_client(self, base_url):
+        client = APIClient(base_url=base_url)
+        # Каждый вызов sync_endpoint должен идти на сервер
+        client._sync_flights.fresh_for = 0
+        self.addCleanup(client.cache.flush, 10)
+        return client
+
+    def registry(self, client):
+        return sorted(client.cache.load_data('registries') or [], key=lambda r: r['id'])
+
+    def test_full_then_not_modified_then_delta(self):
+        state = StubState([{'id': 1, 'marsh': 'A'}, {'id': 2, 'marsh': 'B'}, {'id': 3, 'marsh': 'C'}])
+        with StubServer(state) as base_url:
+            client = self.make_client(base_url)
+
+            # Первая загрузка — полная, без условий
+            self.assertTrue(client.sync_endpoint('registries'))
+            self.assertEqual(self.registry(client), state.full_list())
+            first = state.requests[-1]
+            self.assertEqual(first['params'], {})
+            self.assertIsNone(first['if_none_match'])
+            meta = client.get_sync_meta('registries')
+            self.assertEqual(meta['etag'], state.etag())
+            self.assertEqual(meta['cursor'], state.now().isoformat())
+
+            # Без изменений — 304, кэш не трогается
+            version = client.cache.get_version('registries')
+            self.assertTrue(client.sync_endpoint('registries'))
+            self.assertEqual(state.requests[-1]['if_none_match'], meta['etag'])
+            self.assertEqual(state.requests[-1]['params'], {'updated_since': meta['cursor']})
+            self.assertEqual(client.cache.get_version('registries'), version)
+
+            # Изменения — приходят только они и вливаются в кэш
+            state.put({'id': 2, 'marsh': 'B2'})
+            state.put({'id': 4, 'marsh': 'D'})
+            state.delete(1)
+            self.assertTrue(client.sync_endpoint('registries'))
+            self.assertEqual(state.requests[-1]['params'], {'updated_since': meta['cursor']})
+            self.assertEqual(self.registry(client), state.full_list())
+            self.assertEqual(client.get_sync_meta('registries')['cursor'], state.now().isoformat())
+            self.assertEqual(len(state.requests), 3)
+
+    def test_fallback_when_server_ignores_updated_since(self):
+        state = StubState([{'id': 1, 'marsh': 'A'}, {'id': 2, 'marsh': 'B'}], delta_supported=False)
+        with StubServer(state) as base_url:
+            client = self.make_client(base_url)
+            self.assertTrue(client.sync_endpoint('registries'))
+
+            state.put({'id': 3, 'marsh': 'C'})
+            state.delete(2)
+            self.assertTrue(client.sync_endpoint('registries'))
+            # Запрос с курсором получил обычный список — повторена полная загрузка
+            self.assertIn('updated_since', state.requests[1]['params'])
+            self.assertEqual(state.requests[2]['params'], {})
+            self.assertEqual(self.registry(client), state.full_list())
+            self.assertFalse(client.get_sync_meta('registries')['delta_supported'])
+
+            # Дальше курсор не отправляется, остается условный запрос по ETag
+            state.put({'id': 1, 'marsh': 'A2'})
+            self.assertTrue(client.sync_endpoint('registries'))
+            self.assertEqual(state.requests[-1]['params'], {})
+            self.assertIsNotNone(state.requests[-1]['if_none_match'])
+            self.assertEqual(self.registry(client), state.full_list())
+
+    def test_server_unavailable(self):
+        state = StubState([{'id': 1}])
+        with StubServer(state) as base_url:
+            pass
+        client = self.make_client(base_url)
+        self.assertFalse(client.sync_endpoint('registries'))
+        self.assertIsNone(client.cache.load_data('registries'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+# tests/test_sqlite_cache.py
+# Кэш в SQLite: миграция из JSON, построчные изменения, поиск и версии
+
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from sqlite_cache import SQLiteCache
+
+
+class SQLiteCacheTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache_dir = Path(tmp.name)
+
+    def open_cache(self):
+        cache = SQLiteCache(self.cache_dir)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_migrates_json_files_once(self):
+        registry = [{'id': 2, 'numberPL': ' 17 '}, {'id': 1, 'numberPL': '16'}]
+        (self.cache_dir / 'registries.json').write_text(json.dumps(registry), encoding='utf-8')
+        (self.cache_dir / 'settings.json').write_text(json.dumps({'theme': 'dark'}), encoding='utf-8')
+        (self.cache_dir / 'broken.json').write_text('{', encoding='utf-8')
+
+        cache = self.open_cache()
+        self.assertEqual(cache.load_data('registries'), registry)
+        self.assertEqual(cache.load_data('settings'), {'theme': 'dark'})
+        self.assertIsNone(cache.load_data('broken'))
+        cache.close()
+
+        # Повторный запуск не переносит файлы заново
+        (self.cache_dir / 'registries.json').write_text(json.dumps([]), encoding='utf-8')
+        self.assertEqual(self.open_cache().load_data('registries'), registry)
+
+    def test_upsert_delete_and_query(self):
+        cache = self.open_cache()
+        cache.save_data('registries', [
+            {'id': 1, 'numberPL': '10', 'marsh': 'A', 'season': 1},
+            {'id': 2, 'numberPL': '11', 'marsh': 'B', 'season': 1},
+        ])
+        cache.upsert_records('registries', [
+            {'id': 2, 'numberPL': '11', 'marsh': 'C', 'season': 2},
+            {'temp_id': 't1', 'numberPL': '12', 'marsh': 'A', 'season': 2, 'driver': {'id': 5}},
+        ])
+        self.assertEqual(cache.delete_records('registries', [1, 99]), 1)
+
+        expected = [
+            {'id': 2, 'numberPL': '11', 'marsh': 'C', 'season': 2},
+            {'temp_id': 't1', 'numberPL': '12', 'marsh': 'A', 'season': 2, 'driver': {'id': 5}},
+        ]
+        self.assertEqual(cache.load_data('registries'), expected)
+        # После сброса памяти список читается из базы в том же виде
+        cache.invalidate('registries')
+        self.assertEqual(cache.load_data('registries'), expected)
+
+        self.assertEqual(cache.query_records('registries', marsh='A'), expected[1:])
+        self.assertEqual(cache.query_records('registries', numberPL=' 11 '), expected[:1])
+        self.assertEqual(cache.query_records('registries', season=2, temp_id='t1'), expected[1:])
+        self.assertEqual(cache.query_records('registries', marsh='A', season=1), [])
+
+    def test_versions_without_reloading(self):
+        cache = self.open_cache()
+        cache.save_data('registries', [{'id': i} for i in range(100)])
+        version = cache.get_version('registries')
+        cache.load_data('registries')
+        misses = cache.get_stats()['misses']
+
+        cache.upsert_records('registries', [{'id': 5, 'marsh': 'X'}, {'id': 200}])
+        cache.delete_records('registries', [7])
+        self.assertEqual(cache.get_version('registries'), version + 2)
+        upserted, deleted = cache.changes_since('registries', version)
+        self.assertEqual(sorted(r['id'] for r in upserted), [5, 200])
+        self.assertEqual(deleted, {'7'})
+        data = cache.load_data('registries')
+        self.assertEqual(len(data), 100)
+        self.assertEqual(data[5], {'id': 5, 'marsh': 'X'})
+        # Ни проверка версии, ни чтение не разбирали строки базы заново
+        self.assertEqual(cache.get_stats()['misses'], misses)
+
+
+if __name__ == '__main__':
+    unittest.main()
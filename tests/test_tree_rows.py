@@ -0,0 +1,108 @@
+# tests/test_tree_rows.py
+# Обновление строк таблицы по разнице — против модели ttk.Treeview
+
+import random
+import unittest
+
+from tree_rows import BULK_MOVE_THRESHOLD, TreeRows
+
+
+class FakeTree:
+    """
+    Строки верхнего уровня Treeview. move() ведет себя как в Tk: строка
+    извлекается из списка и вставляется на позицию index среди остальных.
+    """
+    def __init__(self):
+        self.children = []
+        self.values = {}
+        self.ops = []
+
+    def get_children(self, item=""):
+        return tuple(self.children)
+
+    def insert(self, parent, index, iid=None, values=(), tags=()):
+        self.ops.append('insert')
+        if index == "end":
+            index = len(self.children)
+        self.children.insert(index, iid)
+        self.values[iid] = (tuple(values), tuple(tags))
+        return iid
+
+    def delete(self, *items):
+        self.ops.append('delete')
+        for iid in items:
+            self.children.remove(iid)
+            del self.values[iid]
+
+    def item(self, iid, values=(), tags=()):
+        self.ops.append('item')
+        self.values[iid] = (tuple(values), tuple(tags))
+
+    def move(self, iid, parent, index):
+        self.ops.append('move')
+        self.children.remove(iid)
+        self.children.insert(max(0, min(index, len(self.children))), iid)
+
+    def set_children(self, parent, *items):
+        self.ops.append('set_children')
+        self.children = list(items)
+
+
+def rows_for(keys, version=0):
+    return [(key, (key, version), ()) for key in keys]
+
+
+class TreeRowsTest(unittest.TestCase):
+    def check(self, rows, tree):
+        self.assertEqual(tree.children, [iid for iid, _, _ in rows])
+        for iid, values, tags in rows:
+            self.assertEqual(tree.values[iid], (tuple(values), tuple(tags)))
+
+    def test_move_down(self):
+        tree = FakeTree()
+        view = TreeRows(tree)
+        view.update(rows_for("abc"))
+        view.update(rows_for("bac"))
+        self.check(rows_for("bac"), tree)
+        self.assertEqual(tree.ops.count('move'), 1)
+
+    def test_move_first_to_end(self):
+        tree = FakeTree()
+        view = TreeRows(tree)
+        view.update(rows_for("abcde"))
+        view.update(rows_for("bcdea"))
+        self.check(rows_for("bcdea"), tree)
+
+    def test_unchanged_rows_untouched(self):
+        tree = FakeTree()
+        view = TreeRows(tree)
+        view.update(rows_for("abc"))
+        tree.ops.clear()
+        self.assertEqual(view.update(rows_for("abc")), 0)
+        self.assertEqual(tree.ops, [])
+
+    def test_random_updates(self):
+        rnd = random.Random(11)
+        pool = [f"r{i}" for i in range(40)]
+        tree = FakeTree()
+        view = TreeRows(tree)
+        for step in range(500):
+            keys = rnd.sample(pool, rnd.randint(0, len(pool)))
+            rows = [(key, (key, rnd.randint(0, 2)), ("t",) if rnd.random() < 0.2 else ())
+                    for key in keys]
+            view.update(rows)
+            self.check(rows, tree)
+
+    def test_bulk_reorder(self):
+        keys = [f"r{i}" for i in range(BULK_MOVE_THRESHOLD * 3)]
+        tree = FakeTree()
+        view = TreeRows(tree)
+        view.update(rows_for(keys))
+        reordered = list(reversed(keys)) + ["new"]
+        view.update(rows_for(reordered))
+        self.check(rows_for(reordered), tree)
+        self.assertIn('set_children', tree.ops)
+
+
+if __name__ == '__main__':
+    unittest.main()
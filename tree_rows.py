@@ -0,0 +1,116 @@
+# tree_rows.py
+
+from bisect import bisect_left
+
+# Если переставить нужно больше строк, порядок задается одной командой set_children
+BULK_MOVE_THRESHOLD = 64
+
+
+def _stable_positions(positions):
+    """
+    Индексы элементов, образующих наибольшую возрастающую подпоследовательность
+    positions — эти строки уже стоят в нужном порядке и не двигаются.
+    """
+    tails = []
+    tails_idx = []
+    prev = [-1] * len(positions)
+    for i, pos in enumerate(positions):
+        j = bisect_left(tails, pos)
+        if j == len(tails):
+            tails.append(pos)
+            tails_idx.append(i)
+        else:
+            tails[j] = pos
+            tails_idx[j] = i
+        prev[i] = tails_idx[j - 1] if j > 0 else -1
+    result = set()
+    i = tails_idx[-1] if tails_idx else -1
+    while i != -1:
+        result.add(i)
+        i = prev[i]
+    return result
+
+
+class TreeRows:
+    """
+    Содержимое ttk.Treeview (строки верхнего уровня), обновляемое по разнице.
+
+    Помнит выведенные строки (iid → значения и теги) и их порядок. update()
+    сравнивает новый набор с прежним и выполняет только нужные операции:
+    delete для исчезнувших, insert для новых, item для изменившихся и move
+    для переставленных (минимум перемещений по наибольшей возрастающей
+    подпоследовательности). Неизменившиеся строки, выделение и прокрутка
+    не трогаются.
+    """
+    def __init__(self, tree):
+        self.tree = tree
+        self.order = []
+        self.rows = {}
+
+    def clear(self):
+        children = self.tree.get_children()
+        if children:
+            self.tree.delete(*children)
+        self.order = []
+        self.rows = {}
+
+    def update(self, rows):
+        """rows — список (iid, значения, теги). Возвращает число выполненных операций."""
+        new_order = []
+        new_rows = {}
+        for iid, values, tags in rows:
+            if iid in new_rows:
+                continue
+            new_rows[iid] = (tuple(values), tuple(tags))
+            new_order.append(iid)
+
+        ops = 0
+        removed = [iid for iid in self.order if iid not in new_rows]
+        if removed:
+            self.tree.delete(*removed)
+            ops += len(removed)
+        current = [iid for iid in self.order if iid in new_rows]
+
+        for iid in current:
+            row = new_rows[iid]
+            if row != self.rows[iid]:
+                self.tree.item(iid, values=row[0], tags=row[1])
+                ops += 1
+
+        if current != new_order:
+            ops += self._reorder(current, new_order, new_rows)
+
+        self.order = new_order
+        self.rows = new_rows
+        return ops
+
+    def _reorder(self, current, new_order, new_rows):
+        new_pos = {iid: i for i, iid in enumerate(new_order)}
+        positions = [new_pos[iid] for iid in current]
+        stable = {current[i] for i in _stable_positions(positions)}
+        to_place = len(new_order) - len(stable)
+
+        if to_place > BULK_MOVE_THRESHOLD:
+            for iid in new_order:
+                if iid not in self.rows:
+                    values, tags = new_rows[iid]
+                    self.tree.insert("", "end", iid=iid, values=values, tags=tags)
+            self.tree.set_children("", *new_order)
+            return to_place
+
+        # Слева направо ставим каждую нестабильную строку сразу после предыдущей
+        mirror = list(current)
+        for i, iid in enumerate(new_order):
+            if iid in stable:
+                continue
+            if iid in self.rows:
+                # Индекс move — позиция среди остальных строк, без самой строки
+                mirror.remove(iid)
+                index = mirror.index(new_order[i - 1]) + 1 if i > 0 else 0
+                self.tree.move(iid, "", index)
+            else:
+                index = mirror.index(new_order[i - 1]) + 1 if i > 0 else 0
+                values, tags = new_rows[iid]
+                self.tree.insert("", index, iid=iid, values=values, tags=tags)
+            mirror.insert(index, iid)
+        return to_place